@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -90,6 +91,18 @@ DATABASES = {
 }
 
 
+# Cache
+# Use a shared backend (memcached, redis or file-based) when running several workers,
+# so that invalidation reaches all of them
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -134,4 +147,88 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Captcha settings
 CAPTCHA_FONT_SIZE = 40
 CAPTCHA_LENGTH = 5
-CAPTCHA_TIMEOUT = 5 * 60  
\ No newline at end of file
+CAPTCHA_TIMEOUT = 5 * 60
+# Accept the answer "PASSED" for every captcha; for load tests only (benchmarks.load)
+CAPTCHA_TEST_MODE = os.getenv("CAPTCHA_TEST_MODE", "False") == "True"
+
+# "db" stores challenges in CaptchaStore; "signed" issues stateless HMAC-signed
+# tokens (captcha_api.signed) and only keeps used tokens in CAPTCHA_SEEN_CACHE
+CAPTCHA_MODE = os.getenv("CAPTCHA_MODE", "db")
+CAPTCHA_SEEN_CACHE = "default"
+
+# Pool of pre-generated captchas (captcha_api.pool)
+CAPTCHA_POOL_SIZE = int(os.getenv("CAPTCHA_POOL_SIZE", "50"))  # upper bound; the pool follows recent demand
+CAPTCHA_POOL_REFILL_AT = 10  # refill in the background when this many are left
+CAPTCHA_POOL_MIN_TTL = 60  # seconds a handed-out captcha must still be valid
+CAPTCHA_POOL_PURGE_INTERVAL = 300  # seconds between purges of expired captchas
+CAPTCHA_POOL_PURGE_BATCH = 1000
+
+# Attachment storage
+POSTS_BLOB_STORE = os.getenv("POSTS_BLOB_STORE", "posts.storage.LocalBlobStore")
+POSTS_BLOB_ROOT = os.getenv("POSTS_BLOB_ROOT", str(BASE_DIR / "media" / "blobs"))
+
+# Image processing: "background" runs Pillow in a bounded process pool,
+# "sync" processes images inside the create request
+POSTS_IMAGE_PROCESSING = os.getenv("POSTS_IMAGE_PROCESSING", "background")
+POSTS_IMAGE_WORKERS = int(os.getenv("POSTS_IMAGE_WORKERS", "2"))
+POSTS_IMAGE_MAX_QUEUED = int(os.getenv("POSTS_IMAGE_MAX_QUEUED", "32"))
+
+# Image engine (posts.images): output format is JPEG, WEBP or PNG
+POSTS_THUMBNAIL_SIZE = (320, 240)
+POSTS_IMAGE_FORMAT = os.getenv("POSTS_IMAGE_FORMAT", "JPEG")
+POSTS_IMAGE_QUALITY = int(os.getenv("POSTS_IMAGE_QUALITY", "80"))
+POSTS_IMAGE_BACKGROUND = (255, 255, 255)
+
+# Comment sanitizer (posts.sanitizer): "auto" uses nh3 when installed, otherwise bleach
+POSTS_SANITIZER_BACKEND = os.getenv("POSTS_SANITIZER_BACKEND", "auto")
+
+# Versioned response cache of the posts list (posts.cache)
+POSTS_LIST_CACHE = "default"
+POSTS_LIST_CACHE_TIMEOUT = int(os.getenv("POSTS_LIST_CACHE_TIMEOUT", "300"))
+
+# Reply tree limits of the list and replies endpoints: levels of replies below every
+# returned post and replies shown per post. Defaults and maxima of the max_depth and
+# max_replies_per_node query parameters; the rest is loaded with GET /api/posts/<id>/replies/
+POSTS_LIST_MAX_DEPTH = int(os.getenv("POSTS_LIST_MAX_DEPTH", "8"))
+POSTS_LIST_MAX_REPLIES = int(os.getenv("POSTS_LIST_MAX_REPLIES", "20"))
+
+# Text search configuration of the PostgreSQL search index (posts.search); "simple"
+# does no stemming, like the SQLite FTS5 fallback
+POSTS_SEARCH_CONFIG = os.getenv("POSTS_SEARCH_CONFIG", "simple")
+
+# Serve the create and list endpoints with native async views (posts.async_views);
+# only useful under an ASGI server
+POSTS_ASYNC_VIEWS = os.getenv("POSTS_ASYNC_VIEWS", "False") == "True"
+
+# New-post push over Server-Sent Events (posts.events): "local" delivers events
+# inside this process only, "postgres" fans them out to every worker via LISTEN/NOTIFY
+POSTS_EVENTS_BACKEND = os.getenv("POSTS_EVENTS_BACKEND", "local")
+POSTS_EVENTS_HEARTBEAT = 15
+POSTS_EVENTS_QUEUE_SIZE = 100
+POSTS_EVENTS_REPLAY_LIMIT = 100
+POSTS_EVENTS_MAX_SUBSCRIBERS = int(os.getenv("POSTS_EVENTS_MAX_SUBSCRIBERS", "100"))
+
+# Upload limits, enforced while the request body arrives (posts.uploads)
+POSTS_UPLOAD_MAX_IMAGE_SIZE = 5 * 1024 * 1024
+POSTS_UPLOAD_MAX_TEXT_SIZE = 100 * 1024
+POSTS_UPLOAD_MAX_REQUEST_SIZE = int(os.getenv("POSTS_UPLOAD_MAX_REQUEST_SIZE", str(20 * 1024 * 1024)))
+
+# Request metrics (posts.metrics), served at /api/posts/metrics/ to staff users or
+# to scrapers sending "Authorization: Bearer <POSTS_METRICS_TOKEN>"
+POSTS_METRICS_TOKEN = os.getenv("POSTS_METRICS_TOKEN", "")
+
+# Logging: the debug output of the posts app (raw and cleaned comment text, every
+# serialized post) is only emitted with POSTS_LOG_LEVEL=DEBUG
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "loggers": {
+        "posts": {"handlers": ["console"], "level": os.getenv("POSTS_LOG_LEVEL", "INFO"), "propagate": False},
+    },
+}
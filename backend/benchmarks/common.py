@@ -0,0 +1,17 @@
+import os
+
+
+# Function to configure Django for the benchmarks that need it (benchmarks.settings by default)
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    import django
+    django.setup()
+
+
+# Function to get the p-th percentile (0-100) of a list of values, nearest-rank method
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
@@ -0,0 +1,48 @@
+"""
+Compare two result files of benchmarks.load, e.g. before and after a change.
+
+Run from the backend directory:
+
+    python -m benchmarks.compare BASELINE.json CANDIDATE.json
+"""
+import argparse
+import json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "queries_mean")
+
+
+def change(old, new):
+    if old is None or new is None:
+        return "-"
+    if old == 0:
+        return "n/a" if new else "0%"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(baseline, candidate):
+    rows = [("throughput_rps", None, baseline["throughput_rps"], candidate["throughput_rps"])]
+    for kind in sorted(set(baseline["endpoints"]) | set(candidate["endpoints"])):
+        old = baseline["endpoints"].get(kind, {})
+        new = candidate["endpoints"].get(kind, {})
+        rows += [(metric, kind, old.get(metric), new.get(metric)) for metric in METRICS]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["summary"]
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)["summary"]
+
+    print(f"{'endpoint':10} {'metric':15} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for metric, kind, old, new in compare(baseline, candidate):
+        print(f"{kind or 'all':10} {metric:15} {str(old):>10} {str(new):>10} {change(old, new):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare the image engine (posts.images.render_image) with the original
+process_image: bytes stored and CPU time per image.
+
+Run from the backend directory:
+
+    python -m benchmarks.images [--repeat N] [--format JPEG|WEBP|PNG] [--quality Q] [--json PATH]
+"""
+import argparse
+import io
+import json
+import time
+from PIL import Image
+from posts.images import render_image
+
+
+# The original process_image, kept here as the baseline
+def legacy_process_image(data):
+    img = Image.open(io.BytesIO(data))
+    img_width, img_height = img.size
+
+    if img_width > 320 or img_height > 240:
+        img.thumbnail((320, 240))
+
+    if img.mode == 'RGBA':
+        img = img.convert('RGB')
+
+    image_temp = io.BytesIO()
+    img.save(image_temp, format='JPEG')
+    return image_temp.getvalue()
+
+
+def _photo(size):
+    # Gradients plus mild noise compress roughly like a photograph
+    width, height = size
+    red = Image.linear_gradient('L').resize(size)
+    green = Image.radial_gradient('L').resize(size)
+    blue = Image.effect_noise(size, 24)
+    return Image.merge('RGB', (red, green, blue))
+
+
+def _encode(img, fmt, **params):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **params)
+    return buffer.getvalue()
+
+
+def sample_images():
+    photo = _photo((4000, 3000))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees, as phones usually write it
+
+    screenshot = _photo((1600, 1200)).convert('RGBA')
+    screenshot.putalpha(Image.linear_gradient('L').resize((1600, 1200)))
+
+    return {
+        'photo 4000x3000 JPEG (EXIF rotated)': _encode(photo, 'JPEG', quality=90, exif=exif),
+        'photo 1920x1080 JPEG': _encode(photo.resize((1920, 1080)), 'JPEG', quality=90),
+        'screenshot 1600x1200 PNG RGBA': _encode(screenshot, 'PNG'),
+        'animation 800x600 GIF': _encode(photo.resize((800, 600)).convert('P'), 'GIF'),
+        'small 300x200 JPEG': _encode(photo.resize((300, 200)), 'JPEG', quality=90),
+    }
+
+
+def measure(func, data, repeat):
+    try:
+        result = func(data)
+    except OSError:
+        # The original function cannot write palette images (GIF) as JPEG
+        return None, None
+    start = time.process_time()
+    for _ in range(repeat):
+        func(data)
+    return result, (time.process_time() - start) / repeat * 1000
+
+
+def run(repeat=5, options=None):
+    options = options or {'size': (320, 240), 'format': 'JPEG', 'quality': 80, 'background': (255, 255, 255)}
+    results = []
+    for name, data in sample_images().items():
+        legacy_bytes, legacy_ms = measure(legacy_process_image, data, repeat)
+        (engine_bytes, _), engine_ms = measure(lambda d: render_image(d, options), data, repeat)
+        results.append({
+            'image': name,
+            'input_bytes': len(data),
+            'legacy_bytes': len(legacy_bytes) if legacy_bytes is not None else None,
+            'legacy_cpu_ms': round(legacy_ms, 2) if legacy_ms is not None else None,
+            'engine_bytes': len(engine_bytes),
+            'engine_cpu_ms': round(engine_ms, 2),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--format', default='JPEG')
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    options = {'size': (320, 240), 'format': args.format.upper(), 'quality': args.quality, 'background': (255, 255, 255)}
+    results = run(args.repeat, options)
+
+    print(f"{'image':40} {'legacy bytes':>12} {'legacy ms':>10} {'engine bytes':>12} {'engine ms':>10}")
+    for row in results:
+        legacy_bytes = row['legacy_bytes'] if row['legacy_bytes'] is not None else 'error'
+        legacy_ms = row['legacy_cpu_ms'] if row['legacy_cpu_ms'] is not None else 'error'
+        print(f"{row['image']:40} {legacy_bytes:>12} {legacy_ms:>10} "
+              f"{row['engine_bytes']:>12} {row['engine_cpu_ms']:>10}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'options': options, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Load driver for the posts API: replays list and create requests from a pool of
+client threads and reports throughput, p50/p95/p99 latency and database queries
+per request.
+
+By default the requests run in-process (django.test.Client) against a fresh test
+database, SQLite or the local Postgres named by DB_NAME, seeded with comment
+threads by the seed_posts command. Images are then processed inside the create
+request. With --url the requests go over HTTP to a running server instead. Start
+that server with CAPTCHA_TEST_MODE=True. Query counts are not available in this mode.
+
+Run from the backend directory:
+
+    python -m benchmarks.load [--scenario list|create|mixed] [--requests N] [--concurrency N]
+        [--threads N] [--files-ratio R] [--image] [--no-cache] [--url URL] [--json PATH]
+"""
+import argparse
+import io
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import setup_django, percentile
+
+setup_django()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from PIL import Image  # noqa: E402
+from posts.pagination import SORT_FIELDS, SORT_ORDERS  # noqa: E402
+from benchmarks.sanitizer import sample_bodies  # noqa: E402
+
+LIST_LIMIT = 25
+
+
+# Function to generate a small PNG that is different every time (no deduplication)
+def sample_image(rng):
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), tuple(rng.randrange(256) for _ in range(3))).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+# Function to build the request list of a run; every entry is (kind, method, path, fields)
+def build_plan(scenario, count, pages, parent_ids, write_ratio, image, seed=1):
+    rng = random.Random(seed)
+    bodies = sample_bodies(100, seed)
+    plan = []
+    for i in range(count):
+        if scenario == "create" or (scenario == "mixed" and rng.random() < write_ratio):
+            fields = {
+                "username": f"bench{i}",
+                "email": "bench@example.com",
+                "text_html": rng.choice(bodies),
+                "captcha_0": "benchmark",
+                "captcha_1": "PASSED",
+                "parent_id": rng.choice(parent_ids) if parent_ids and rng.random() < 0.5 else "null",
+            }
+            if image:
+                fields["files"] = sample_image(rng)
+            plan.append(("create", "POST", "/api/posts/create/", fields))
+        else:
+            query = (
+                f"page={rng.randint(1, pages)}&limit={LIST_LIMIT}"
+                f"&sort_by={rng.choice(SORT_FIELDS)}&sort_order={rng.choice(SORT_ORDERS)}"
+            )
+            plan.append(("list", "GET", f"/api/posts/get/?{query}", None))
+    return plan
+
+
+def multipart_fields(fields):
+    data = dict(fields)
+    if "files" in data:
+        data["files"] = SimpleUploadedFile("image.png", data["files"], "image/png")
+    return data
+
+
+# Requests through django.test.Client in this process, with a query counter per request
+class InProcessTarget:
+    name = "in-process"
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def send(self, method, path, fields=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = Client()
+
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            if method == "POST":
+                response = client.post(path, multipart_fields(fields))
+            else:
+                response = client.get(path)
+        return response.status_code, time.perf_counter() - started, queries, response.get("X-Cache"), response.content
+
+    def close_thread(self):
+        # Every worker thread opened its own connection
+        connection.close()
+
+
+# Requests over HTTP to a running server
+class HTTPTarget:
+    name = "http"
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def send(self, method, path, fields=None):
+        data, headers = None, {}
+        if method == "POST":
+            data = encode_multipart(BOUNDARY, multipart_fields(fields))
+            headers["Content-Type"] = MULTIPART_CONTENT
+        request = urllib.request.Request(self.url + path, data=data, headers=headers, method=method)
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                content = response.read()
+                status, cache = response.status, response.headers.get("X-Cache")
+        except urllib.error.HTTPError as e:
+            content, status, cache = e.read(), e.code, None
+        return status, time.perf_counter() - started, None, cache, content
+
+    def close_thread(self):
+        pass
+
+
+# Function to send every request of the plan from `concurrency` threads; returns (samples, seconds)
+def drive(target, plan, concurrency):
+    samples = [None] * len(plan)
+    indexes = itertools.count()
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    i = next(indexes)
+                if i >= len(plan):
+                    return
+                kind, method, path, fields = plan[i]
+                status, seconds, queries, cache, _ = target.send(method, path, fields)
+                samples[i] = (kind, status, seconds, queries, cache)
+        finally:
+            target.close_thread()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for kind in sorted({sample[0] for sample in samples}):
+        rows = [sample for sample in samples if sample[0] == kind]
+        latencies = [row[2] * 1000 for row in rows]
+        queries = [row[3] for row in rows if row[3] is not None]
+        caches = [row[4] for row in rows if row[4]]
+        endpoints[kind] = {
+            "requests": len(rows),
+            "errors": sum(1 for row in rows if row[1] >= 400),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(max(latencies), 2),
+            "queries_mean": round(sum(queries) / len(queries), 1) if queries else None,
+            "queries_p95": percentile(queries, 95),
+            "cache_hit_ratio": round(caches.count("HIT") / len(caches), 3) if caches else None,
+        }
+    return {
+        "requests": len(samples),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "endpoints": endpoints,
+    }
+
+
+# Function to discover top-level post ids to reply to, and the number of list pages
+def discover(target):
+    status, _, _, _, content = target.send("GET", "/api/posts/get/?limit=100")
+    if status != 200:
+        raise SystemExit(f"GET /api/posts/get/ returned {status}")
+    data = json.loads(content)
+    parent_ids = [post["id"] for post in data["posts"]]
+    pages = max(1, -(-data["totalPages"] * 100 // LIST_LIMIT))
+    return parent_ids, pages
+
+
+def run(args, target):
+    parent_ids, pages = discover(target)
+    warmup = build_plan("list", args.warmup, pages, parent_ids, 0, False, args.seed + 1)
+    drive(target, warmup, args.concurrency)
+
+    plan = build_plan(args.scenario, args.requests, pages, parent_ids, args.write_ratio, args.image, args.seed)
+    samples, elapsed = drive(target, plan, args.concurrency)
+    return summarize(samples, elapsed)
+
+
+def run_in_process(args):
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        call_command("seed_posts", threads=args.threads, files_ratio=args.files_ratio, seed=args.seed)
+        overrides = {"POSTS_IMAGE_PROCESSING": "sync"}
+        if args.no_cache:
+            overrides["POSTS_LIST_CACHE_TIMEOUT"] = 0
+        with override_settings(**overrides):
+            return run(args, InProcessTarget())
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["list", "create", "mixed"], default="mixed")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="Share of creates in the mixed scenario")
+    parser.add_argument("--threads", type=int, default=200, help="Top-level posts to seed (in-process)")
+    parser.add_argument("--files-ratio", type=float, default=0.1, help="Share of seeded posts with attachments (in-process)")
+    parser.add_argument("--image", action="store_true", help="Attach a PNG to every created post")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the list cache (in-process)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="Base URL of a running server, e.g. http://localhost:8000")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    if args.url:
+        summary = run(args, HTTPTarget(args.url))
+    else:
+        summary = run_in_process(args)
+
+    print(f"{summary['requests']} requests in {summary['elapsed_s']} s: {summary['throughput_rps']} req/s")
+    print(f"{'endpoint':10} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'queries':>8} {'cache hit':>9}")
+    for kind, row in summary["endpoints"].items():
+        queries = row["queries_mean"] if row["queries_mean"] is not None else "-"
+        hits = row["cache_hit_ratio"] if row["cache_hit_ratio"] is not None else "-"
+        print(f"{kind:10} {row['requests']:>8} {row['errors']:>6} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row['p99_ms']:>8} {row['max_ms']:>8} {queries:>8} {hits:>9}")
+
+    if args.json:
+        config = {key: value for key, value in vars(args).items() if key != "json"}
+        config["target"] = "http" if args.url else "in-process"
+        config["database"] = None if args.url else connection.vendor
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
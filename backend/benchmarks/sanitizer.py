@@ -0,0 +1,106 @@
+"""
+Compare the single-pass sanitizer (posts.sanitizer) with the original
+three-pass pipeline (format_preview regexes, newline regexes, bleach.clean)
+over realistic comment bodies.
+
+Run from the backend directory:
+
+    python -m benchmarks.sanitizer [--repeat N] [--json PATH]
+"""
+import argparse
+import json
+import random
+import re
+import time
+import bleach
+from posts.sanitizer import BACKENDS, sanitize
+
+WORDS = (
+    "the comment thread reply thanks agree link code python django server page "
+    "image works fine error again later update version please check this"
+).split()
+
+
+# The original pipeline: PostCreateView.format_preview, then PostFormWithCaptcha.clean_text_html
+def legacy_sanitize(text):
+    text = text.replace("\n", "<br>")
+    text = re.sub(r"<(?!\/?(a|code|i|strong|br)(\s[^>]*|)\/?>)[^>]+>", "", text)
+    text = re.sub(r'<(?!a\s)(\w+)([^>]*?)>', r'<\1>', text)
+    text = re.sub(r'<a([^>]*?)(?!\s(?:href|title)[^>]*)(\s[^>]*?)?>', r'<a\1>', text)
+
+    text = re.sub(r'\n{3,}', '<br><br><br>', text)
+    text = re.sub(r'\n\n', '<br><br>', text)
+    text = text.replace('\n', '<br>')
+    return bleach.clean(text, tags=["a", "code", "i", "strong", "br"], attributes={"a": ["href", "title"]}, strip=True)
+
+
+def _sentence(rng):
+    words = rng.choices(WORDS, k=rng.randint(5, 20))
+    markup = rng.random()
+    if markup < 0.15:
+        words.insert(rng.randrange(len(words)), '<a href="https://example.com/page" title="page">link</a>')
+    elif markup < 0.25:
+        words.insert(rng.randrange(len(words)), "<code>print(value)</code>")
+    elif markup < 0.32:
+        words.insert(rng.randrange(len(words)), "<strong><i>important</i></strong>")
+    elif markup < 0.36:
+        words.insert(rng.randrange(len(words)), '<img src=x onerror="alert(1)"><script>alert(1)</script>')
+    elif markup < 0.40:
+        words.insert(rng.randrange(len(words)), '<a href="javascript:alert(1)" onclick="x()">bad</a>')
+    return " ".join(words).capitalize() + "."
+
+
+def sample_bodies(count=200, seed=1):
+    rng = random.Random(seed)
+    bodies = []
+    for _ in range(count):
+        paragraphs = [
+            " ".join(_sentence(rng) for _ in range(rng.randint(1, 5)))
+            for _ in range(rng.choice([1, 1, 1, 2, 3, 6]))
+        ]
+        bodies.append(rng.choice(["\n", "\n\n"]).join(paragraphs))
+    return bodies
+
+
+def measure(func, bodies, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            func(body)
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(bodies)) * 1_000_000
+
+
+def run(repeat=5):
+    bodies = sample_bodies()
+    candidates = {"legacy (3 passes)": legacy_sanitize}
+    for name in BACKENDS:
+        try:
+            sanitize("", backend=name)
+        except ImportError:
+            continue
+        candidates[name] = lambda text, name=name: sanitize(text, backend=name)
+
+    return [
+        {"sanitizer": name, "us_per_body": round(measure(func, bodies, repeat), 1)}
+        for name, func in candidates.items()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    for row in results:
+        print(f"{row['sanitizer']:20} {row['us_per_body']:>10} us/body")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Measure the list serializers over in-memory comment threads shaped like a page of
+the posts list (no database access): PostSerializer over trees built as
+load_threads() builds them, and serialize_threads() over the rows that
+load_thread_rows() returns. The "+ JSON" rows include encoding the page, as the
+list endpoint does (JsonResponse before, dump_json() now).
+
+Run from the backend directory:
+
+    python -m benchmarks.serializer [--threads N] [--fanout N] [--depth N] [--repeat N] [--json PATH]
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from benchmarks.common import setup_django
+
+setup_django()
+
+from django.utils import timezone  # noqa: E402
+from posts.models import Post, FileForPost  # noqa: E402
+from django.core.serializers.json import DjangoJSONEncoder  # noqa: E402
+from posts.serializers import PostSerializer, serialize_threads  # noqa: E402
+from posts.tree import post_row, FILE_COLUMNS  # noqa: E402
+from posts.utils import dump_json  # noqa: E402
+from benchmarks.sanitizer import sample_bodies  # noqa: E402
+
+
+# Function to build one page of threads; every post has `fanout` replies down to `depth`
+def build_page(threads=25, fanout=3, depth=3, seed=1):
+    rng = random.Random(seed)
+    bodies = sample_bodies(50, seed)
+    ids = itertools.count(1)
+    now = timezone.now()
+
+    def node(parent, level):
+        post = Post(
+            id=next(ids),
+            username=f"user{rng.randrange(1000)}",
+            email="user@example.com",
+            homepage_url=rng.choice([None, "https://example.com"]),
+            text_html=rng.choice(bodies),
+            parent=parent,
+            depth=level,
+            created_at=now,
+            updated_at=now,
+            last_activity_at=now,
+        )
+        post.tree_files = [
+            FileForPost(id=next(ids), post=post, sha256="0" * 64, filename="image.jpg",
+                        content_type="image/jpeg", size=1024)
+            for _ in range(rng.choice([0, 0, 0, 1, 2]))
+        ]
+        post.tree_replies = [node(post, level + 1) for _ in range(fanout)] if level < depth else []
+        return post
+
+    return [node(None, 0) for _ in range(threads)]
+
+
+def count_nodes(posts):
+    return sum(1 + count_nodes(post.tree_replies) for post in posts)
+
+
+# Function to convert a page to the rows of load_thread_rows(); returns (roots, descendants, files)
+def page_rows(page):
+    descendants, files = [], []
+
+    def walk(post):
+        files.extend({column: getattr(record, column) for column in FILE_COLUMNS} for record in post.tree_files)
+        for reply in post.tree_replies:
+            descendants.append(post_row(reply))
+            walk(reply)
+
+    for post in page:
+        walk(post)
+    return [post_row(post) for post in page], descendants, files
+
+
+# Function to get the mean seconds of one call
+def measure(function, repeat):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(threads=25, fanout=3, depth=3, repeat=5):
+    page = build_page(threads, fanout, depth)
+    rows = page_rows(page)
+    nodes = count_nodes(page)
+
+    cases = {
+        "PostSerializer": lambda: PostSerializer(page, many=True).data,
+        "serialize_threads": lambda: serialize_threads(*rows),
+        "PostSerializer + JSON": lambda: json.dumps(
+            {"posts": PostSerializer(page, many=True).data}, cls=DjangoJSONEncoder
+        ).encode("utf-8"),
+        "serialize_threads + JSON": lambda: dump_json({"posts": serialize_threads(*rows)}),
+    }
+    results = []
+    for name, function in cases.items():
+        elapsed = measure(function, repeat)
+        results.append({
+            "serializer": name,
+            "nodes": nodes,
+            "ms_per_page": round(elapsed * 1000, 2),
+            "us_per_node": round(elapsed / nodes * 1_000_000, 1),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=25, help="Top-level posts on the page")
+    parser.add_argument("--fanout", type=int, default=3, help="Replies per post")
+    parser.add_argument("--depth", type=int, default=3, help="Reply levels below each top-level post")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.threads, args.fanout, args.depth, args.repeat)
+    for row in results:
+        print(f"{row['serializer']:26} {row['nodes']:>6} nodes {row['ms_per_page']:>10} ms/page "
+              f"{row['us_per_node']:>8} us/node")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"threads": args.threads, "fanout": args.fanout, "depth": args.depth, "results": results},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import os
+import tempfile
+from backend.settings import *  # noqa: F401,F403
+
+# Settings of the benchmarks that need Django (serializer, load). Captcha answers
+# "PASSED" are accepted and attachments go to a throwaway directory.
+SECRET_KEY = os.getenv("SECRET_KEY", "benchmark")
+DEBUG = False
+CAPTCHA_TEST_MODE = True
+POSTS_BLOB_ROOT = os.getenv("POSTS_BLOB_ROOT", os.path.join(tempfile.gettempdir(), "webcomments-benchmark-blobs"))
+
+# SQLite unless DB_NAME names a (local) Postgres database. The load driver runs in a
+# separate test database (test_<DB_NAME>) that is created and dropped for every run.
+if not os.getenv("DB_NAME"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(tempfile.gettempdir(), "webcomments-benchmark.sqlite3"),
+            # Writers queue for the lock instead of failing with "database is locked"
+            "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+            # A file, not the in-memory default, so that worker threads share it
+            "TEST": {"NAME": os.path.join(tempfile.gettempdir(), "test-webcomments-benchmark.sqlite3")},
+        }
+    }
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from captcha_api.pool import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired captchas in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per DELETE.")
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired captchas."))
@@ -0,0 +1,170 @@
+import datetime
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.utils import timezone
+from captcha.conf import settings as captcha_settings
+from captcha.fields import CaptchaField
+from captcha.models import CaptchaStore
+from captcha.views import _captcha_image
+
+IMAGE_KEY = "captcha_api:image:{}"
+
+
+# Function to render the PNG of a stored challenge, exactly as captcha.views.captcha_image does
+def render_captcha(store):
+    try:
+        # Same seed as the captcha app, so both render the same image for a key
+        random.seed(store.hashkey)
+        response = _captcha_image(store, 1)
+    finally:
+        random.seed()
+    return response.content, response["Content-Type"]
+
+
+# Function to insert a batch of challenges with one query; returns the saved rows
+def generate_challenges(count):
+    expiration = timezone.now() + datetime.timedelta(minutes=int(captcha_settings.CAPTCHA_TIMEOUT))
+    stores = []
+    for _ in range(count):
+        challenge, response = captcha_settings.get_challenge()()
+        stores.append(CaptchaStore(
+            challenge=challenge,
+            response=response.lower(),
+            hashkey=secrets.token_hex(20),
+            expiration=expiration,
+        ))
+    return CaptchaStore.objects.bulk_create(stores)
+
+
+# Function to delete expired challenges in batches, keeping each DELETE short; returns the count
+def purge_expired(batch_size=None):
+    batch_size = batch_size or settings.CAPTCHA_POOL_PURGE_BATCH
+    expired = CaptchaStore.objects.filter(expiration__lte=timezone.now()).values_list("id", flat=True)
+    deleted = 0
+    while True:
+        ids = list(expired[:batch_size])
+        if not ids:
+            return deleted
+        deleted += CaptchaStore.objects.filter(id__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return deleted
+
+
+# CaptchaField without its purge: CaptchaField.clean() deletes every expired challenge on
+# each validation, which purge_expired() does in batches instead. Validation is otherwise
+# the same: one attempt per challenge, "PASSED" accepted in CAPTCHA_TEST_MODE
+class PooledCaptchaField(CaptchaField):
+    def clean(self, value):
+        super(CaptchaField, self).clean(value)
+        key, response = value[0], (value[1] or "").strip().lower()
+        value[1] = ""
+        if captcha_settings.CAPTCHA_TEST_MODE and response == "passed":
+            CaptchaStore.objects.filter(hashkey=key).delete()
+        elif not self.required and not response:
+            pass
+        else:
+            store = CaptchaStore.objects.filter(hashkey=key, expiration__gt=timezone.now()).first()
+            # Delete the challenge even when the answer is wrong, against brute force
+            if store is not None:
+                store.delete()
+            if store is None or store.response != response:
+                raise ValidationError(self.error_messages["invalid"])
+        return value
+
+
+# Buffer of pre-generated challenges with their images already rendered.
+# take() is a deque pop; a background thread refills the buffer and purges expired rows.
+# The buffer only grows to the number of captchas taken within the usable lifetime of a
+# challenge, so an idle pool does not keep generating challenges that expire unused.
+class CaptchaPool:
+    def __init__(self):
+        self._entries = deque()
+        # Times of the last takes; beyond CAPTCHA_POOL_SIZE they would not change the target
+        self._takes = deque(maxlen=settings.CAPTCHA_POOL_SIZE)
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._last_purge = 0
+
+    def size(self):
+        return len(self._entries)
+
+    # Function to get the number of entries to keep: the takes within the time a new challenge
+    # can be handed out, at most CAPTCHA_POOL_SIZE
+    def target(self):
+        window = int(captcha_settings.CAPTCHA_TIMEOUT) * 60 - settings.CAPTCHA_POOL_MIN_TTL
+        since = time.monotonic() - window
+        with self._lock:
+            while self._takes and self._takes[0] < since:
+                self._takes.popleft()
+            return min(settings.CAPTCHA_POOL_SIZE, len(self._takes))
+
+    def take(self):
+        # Entries are in generation order, so the oldest ones expire first
+        min_expiration = timezone.now() + datetime.timedelta(seconds=settings.CAPTCHA_POOL_MIN_TTL)
+        entry = None
+        with self._lock:
+            self._takes.append(time.monotonic())
+            while self._entries:
+                candidate = self._entries.popleft()
+                if candidate["expiration"] > min_expiration:
+                    entry = candidate
+                    break
+        if len(self._entries) < min(settings.CAPTCHA_POOL_REFILL_AT + 1, self.target()):
+            self.refill_async()
+        if entry is None:
+            # Empty pool (cold start or burst): fall back to the captcha app
+            return CaptchaStore.generate_key()
+
+        # The image view serves these bytes until the challenge expires
+        timeout = (entry["expiration"] - timezone.now()).total_seconds()
+        cache.set(IMAGE_KEY.format(entry["key"]), (entry["image"], entry["content_type"]), timeout)
+        return entry["key"]
+
+    def refill(self):
+        missing = self.target() - len(self._entries)
+        if missing > 0:
+            entries = []
+            for store in generate_challenges(missing):
+                image, content_type = render_captcha(store)
+                entries.append({
+                    "key": store.hashkey,
+                    "expiration": store.expiration,
+                    "image": image,
+                    "content_type": content_type,
+                })
+            with self._lock:
+                self._entries.extend(entries)
+
+        if time.monotonic() - self._last_purge >= settings.CAPTCHA_POOL_PURGE_INTERVAL:
+            self._last_purge = time.monotonic()
+            purge_expired()
+
+    def refill_async(self):
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill_thread, name="captcha-pool-refill", daemon=True).start()
+
+    def _refill_thread(self):
+        # Runs in its own thread, which needs its own DB connection
+        try:
+            self.refill()
+        finally:
+            self._refilling = False
+            connection.close()
+
+
+pool = CaptchaPool()
+
+
+# Function to get the cached image of a challenge handed out by the pool, or None
+def get_cached_image(key):
+    return cache.get(IMAGE_KEY.format(key))
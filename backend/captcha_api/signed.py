@@ -0,0 +1,84 @@
+import secrets
+import time
+from django import forms
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+from captcha.conf import settings as captcha_settings
+from captcha.models import CaptchaStore
+
+# Stateless captchas (CAPTCHA_MODE = "signed"): the token carries a random nonce
+# and is signed with SECRET_KEY; the answer is an HMAC of the nonce, so the server
+# can recompute it without storing anything and the client cannot derive it.
+
+SALT = "captcha_api.signed"
+SEEN_KEY = "captcha_api:seen:{}"
+CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+# Function to get the lifetime of a token in seconds (CAPTCHA_TIMEOUT is in minutes)
+def token_ttl():
+    return int(captcha_settings.CAPTCHA_TIMEOUT) * 60
+
+
+# Function to derive the challenge text of a nonce
+def challenge_for(nonce):
+    digest = salted_hmac(SALT, nonce).digest()
+    return "".join(CHARS[byte % len(CHARS)] for byte in digest[:captcha_settings.CAPTCHA_LENGTH])
+
+
+# Function to issue a new signed token
+def issue_token():
+    return signing.dumps({"n": secrets.token_urlsafe(12), "t": int(time.time())}, salt=SALT)
+
+
+# Function to read a token; returns (nonce, issued_at) or raises signing.BadSignature
+def read_token(token):
+    data = signing.loads(token, salt=SALT, max_age=token_ttl())
+    return data["n"], data["t"]
+
+
+# Function to build an unsaved CaptchaStore, so the captcha app can render the image
+def token_store(token):
+    nonce, _ = read_token(token)
+    return CaptchaStore(challenge=challenge_for(nonce), hashkey=token)
+
+
+# Function to check an answer; every token can be attempted once
+def verify_token(token, answer):
+    try:
+        nonce, issued_at = read_token(token)
+    except (signing.BadSignature, KeyError, TypeError):
+        return False
+
+    # Remember the nonce until the token expires anyway; add() is atomic in shared caches
+    ttl = max(1, int(issued_at + token_ttl() - time.time()))
+    if not caches[settings.CAPTCHA_SEEN_CACHE].add(SEEN_KEY.format(nonce), 1, ttl):
+        return False
+
+    answer = (answer or "").strip().lower()
+    if captcha_settings.CAPTCHA_TEST_MODE and answer == "passed":
+        return True
+    return constant_time_compare(answer, challenge_for(nonce).lower())
+
+
+# Drop-in replacement of captcha.fields.CaptchaField: reads the same captcha_0 (token)
+# and captcha_1 (answer) inputs, without touching the database
+class SignedCaptchaField(forms.MultiValueField):
+    widget = forms.MultiWidget(widgets=[forms.HiddenInput, forms.TextInput])
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("error_messages", {}).setdefault("invalid", "Invalid CAPTCHA")
+        super().__init__((forms.CharField(), forms.CharField()), *args, **kwargs)
+
+    def compress(self, data_list):
+        if data_list:
+            return ",".join(data_list)
+        return None
+
+    def clean(self, value):
+        super().clean(value)
+        if not verify_token(value[0], value[1]):
+            raise forms.ValidationError(self.error_messages["invalid"], code="invalid")
+        return value
@@ -1,3 +1,178 @@
-from django.test import TestCase
+import datetime
+import json
+import time
+from unittest import mock
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from captcha.models import CaptchaStore
+from posts.forms import PostFormWithCaptcha
+from .pool import CaptchaPool, PooledCaptchaField, get_cached_image
+from .signed import SignedCaptchaField, challenge_for, issue_token, read_token, token_ttl, verify_token
 
-# Create your tests here.
+
+class PooledCaptchaFieldTests(TestCase):
+    def setUp(self):
+        self.field = PooledCaptchaField()
+        self.key = CaptchaStore.generate_key()
+        self.answer = CaptchaStore.objects.get(hashkey=self.key).response
+
+    def test_valid_answer_is_used_once(self):
+        self.field.clean([self.key, self.answer.upper()])
+        with self.assertRaises(ValidationError):
+            self.field.clean([self.key, self.answer])
+
+    def test_wrong_answer_invalidates_the_challenge(self):
+        with self.assertRaises(ValidationError):
+            self.field.clean([self.key, "wrong"])
+        self.assertFalse(CaptchaStore.objects.filter(hashkey=self.key).exists())
+
+    def test_expired_challenges_are_left_to_the_purge(self):
+        expired_key = CaptchaStore.generate_key()
+        CaptchaStore.objects.filter(hashkey=expired_key).update(expiration=timezone.now() - datetime.timedelta(minutes=1))
+
+        self.field.clean([self.key, self.answer])
+        self.assertTrue(CaptchaStore.objects.filter(hashkey=expired_key).exists())
+        with self.assertRaises(ValidationError):
+            self.field.clean([expired_key, "x"])
+
+
+@override_settings(CAPTCHA_POOL_SIZE=5, CAPTCHA_POOL_REFILL_AT=2, CAPTCHA_POOL_MIN_TTL=60)
+class CaptchaPoolTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.pool = CaptchaPool()
+        # Refill in the test thread, which owns the test transaction
+        self.pool.refill_async = self.pool.refill
+
+    def test_refill_follows_demand(self):
+        # Cold start: the first key comes from the captcha app, the refill follows
+        first = self.pool.take()
+        self.assertIsNone(get_cached_image(first))
+        self.assertEqual(self.pool.size(), 1)
+
+        keys = [self.pool.take() for _ in range(9)]
+        self.assertTrue(all(get_cached_image(key) for key in keys))
+        self.assertEqual(len(set(keys + [first])), 10)
+        # Capped by CAPTCHA_POOL_SIZE; refilled below CAPTCHA_POOL_REFILL_AT + 1
+        self.assertEqual(self.pool.target(), 5)
+        self.assertGreaterEqual(self.pool.size(), 2)
+        self.assertLessEqual(self.pool.size(), 5)
+
+    def test_soon_expiring_entries_are_discarded(self):
+        for _ in range(3):
+            self.pool.take()
+        pooled = {entry["key"] for entry in self.pool._entries}
+        self.assertEqual(len(pooled), 3)
+
+        # Every pooled challenge now expires within CAPTCHA_POOL_MIN_TTL
+        for entry in self.pool._entries:
+            entry["expiration"] = timezone.now() + datetime.timedelta(seconds=30)
+        key = self.pool.take()
+        self.assertNotIn(key, pooled)
+        self.assertIsNone(get_cached_image(key))
+        # Refilled with fresh entries; the discarded rows are left to the purge
+        self.assertEqual(self.pool.size(), 4)
+        self.assertTrue(pooled.isdisjoint(entry["key"] for entry in self.pool._entries))
+        self.assertEqual(CaptchaStore.objects.filter(hashkey__in=pooled).count(), 3)
+
+    # Takes older than the usable lifetime of a challenge no longer count
+    def test_idle_pool_shrinks(self):
+        for _ in range(5):
+            self.pool.take()
+        self.assertEqual(self.pool.target(), 5)
+
+        later = time.monotonic() + token_ttl()
+        with mock.patch("captcha_api.pool.time.monotonic", return_value=later):
+            self.assertEqual(self.pool.target(), 0)
+            for entry in self.pool._entries:
+                entry["expiration"] = timezone.now()
+            count = CaptchaStore.objects.count()
+            self.pool.take()
+            # One fresh entry for the one take, instead of a full pool
+            self.assertEqual(self.pool.size(), 1)
+            self.assertEqual(CaptchaStore.objects.count(), count + 2)
+
+
+# Function to get the answer of a signed token, as the rendered image shows it
+def signed_answer(token):
+    nonce, _ = read_token(token)
+    return challenge_for(nonce)
+
+
+class VerifyTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.token = issue_token()
+
+    def test_valid_token(self):
+        self.assertTrue(verify_token(self.token, signed_answer(self.token).lower()))
+
+    def test_wrong_answer(self):
+        self.assertFalse(verify_token(self.token, "wrong"))
+
+    def test_tampered_signature(self):
+        answer = signed_answer(self.token)
+        value, signature = self.token.rsplit(":", 1)
+        tampered = f"{value}:{signature[:-1]}{'A' if signature[-1] != 'A' else 'B'}"
+        self.assertFalse(verify_token(tampered, answer))
+        # The failed attempt did not use up the real token
+        self.assertTrue(verify_token(self.token, answer))
+
+    def test_expired_token(self):
+        issued_at = time.time() - token_ttl() - 1
+        with mock.patch("time.time", return_value=issued_at):
+            token = issue_token()
+            answer = signed_answer(token)
+        with self.assertRaises(signing.SignatureExpired):
+            read_token(token)
+        self.assertFalse(verify_token(token, answer))
+
+    # The seen-set rejects a replay, even with the right answer
+    def test_replay_is_rejected(self):
+        answer = signed_answer(self.token)
+        self.assertTrue(verify_token(self.token, answer))
+        self.assertFalse(verify_token(self.token, answer))
+
+    def test_wrong_answer_uses_up_the_token(self):
+        answer = signed_answer(self.token)
+        self.assertFalse(verify_token(self.token, "wrong"))
+        self.assertFalse(verify_token(self.token, answer))
+
+
+# PostFormWithCaptcha as it is defined with CAPTCHA_MODE = "signed"
+class SignedPostForm(PostFormWithCaptcha):
+    captcha = SignedCaptchaField()
+
+
+@override_settings(CAPTCHA_MODE="signed")
+class SignedCaptchaFieldTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def form(self, token, answer):
+        return SignedPostForm({
+            "username": "user", "email": "user@example.com", "text_html": "Text",
+            "captcha_0": token, "captcha_1": answer,
+        })
+
+    def test_token_from_the_api(self):
+        token = json.loads(self.client.get("/api/captcha/").content)["captcha_key"]
+        self.assertEqual(self.client.get(f"/api/captcha/image/{token}/").status_code, 200)
+        self.assertFalse(CaptchaStore.objects.exists())
+
+        form = self.form(token, signed_answer(token))
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertFalse(self.form(token, signed_answer(token)).is_valid())
+
+    def test_invalid_captcha(self):
+        token = issue_token()
+        for data in [(token, "wrong"), ("not a token", "x"), (token, "")]:
+            form = self.form(*data)
+            self.assertFalse(form.is_valid())
+            self.assertIn("captcha", form.errors)
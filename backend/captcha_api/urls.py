@@ -3,4 +3,5 @@ from .views import *
 
 urlpatterns = [
     path("", CaptchaAPIView.as_view(), name="captcha"),
+    path("image/<str:key>/", CaptchaImageView.as_view(), name="captcha-pool-image"),
 ]
@@ -1,15 +1,52 @@
 from rest_framework.views import APIView
-from django.http import JsonResponse
-from captcha.models import CaptchaStore
-from captcha.helpers import captcha_image_url
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse, HttpResponse
+from django.urls import reverse
+from django.views import View
+from captcha.views import captcha_image
+from .pool import pool, get_cached_image, render_captcha
+from .signed import issue_token, token_store
 
 class CaptchaAPIView(APIView):
     def get(self, request):
-        key = CaptchaStore.generate_key()
-        relative_url = captcha_image_url(key)
+        if settings.CAPTCHA_MODE == "signed":
+            # Stateless token: nothing is stored
+            key = issue_token()
+        else:
+            # Pre-generated challenge from the pool: no DB write and no rendering here
+            key = pool.take()
+        relative_url = reverse("captcha-pool-image", args=[key])
         full_url = request.build_absolute_uri(relative_url)
 
         return JsonResponse({
             "captcha_key": key,
             "captcha_image_url": full_url,
         })
+
+class CaptchaImageView(View):
+    def get(self, request, key):
+        if settings.CAPTCHA_MODE == "signed":
+            return self.get_signed(key)
+
+        cached = get_cached_image(key)
+        if cached is None:
+            # Not rendered by this process (or evicted): render it like the captcha app
+            return captcha_image(request, key)
+
+        image, content_type = cached
+        response = HttpResponse(image, content_type=content_type)
+        response["Content-Length"] = len(image)
+        return response
+
+    def get_signed(self, key):
+        try:
+            store = token_store(key)
+        except signing.BadSignature:
+            # Same status as the captcha app for unknown or expired keys
+            return HttpResponse(status=410)
+
+        image, content_type = render_captcha(store)
+        response = HttpResponse(image, content_type=content_type)
+        response["Content-Length"] = len(image)
+        return response
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'posts'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import signals  # noqa: F401
+        from .metrics import install_query_counter
+
+        # Count the queries of every request (posts.metrics)
+        connection_created.connect(install_query_counter)
@@ -0,0 +1,120 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .models import Post, ChangeSequence
+from .serializers import serialize_threads
+from .tree import aload_thread_rows
+from .pagination import apaginate_by_page, apaginate_by_cursor, estimate_total_pages, get_ordering
+from .cache import list_cache_key, get_cached_list, set_cached_list
+from .events import broker, missed_events, aiter_events
+from .views import (
+    PostCreateView, LIST_PARAMS, parse_list_params, parse_tree_limits, list_validators, add_list_validators,
+    cached_list_response, events_response, too_many_subscribers_response, json_response,
+)
+
+# Native async versions of PostCreateView, PostListView and PostEventsView for ASGI deployments
+# (enabled with POSTS_ASYNC_VIEWS). Reads use the async ORM; ORM work runs in the thread-sensitive
+# worker, and only pure CPU work (serialization) in other worker threads, so the event loop keeps
+# serving other requests.
+
+
+# PostCreateView behind an async entry point. Creating a post goes through DRF authentication,
+# CSRF checks and throttling, form validation (captcha), attachments and the post transaction:
+# all sync and ORM work, so the whole request runs in the thread-sensitive worker, with the same
+# policy, order of checks and connection handling as under WSGI. DRF enforces CSRF itself for
+# session-authenticated requests, hence the exemption from the middleware, as for APIView
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncPostCreateView(View):
+    create_view = staticmethod(PostCreateView.as_view())
+
+    async def post(self, request):
+        return await sync_to_async(self.create_view)(request)
+
+
+class AsyncPostListView(View):
+    async def get(self, request):
+        # Answer "nothing changed" with 304 before any serialization
+        sequence = await ChangeSequence.acurrent()
+        etag, last_modified = list_validators(request, sequence)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return add_list_validators(not_modified, etag, last_modified)
+
+        cache_key = list_cache_key(sequence, request, LIST_PARAMS)
+        content = await sync_to_async(get_cached_list)(cache_key)
+        if content is not None:
+            return add_list_validators(cached_list_response(content), etag, last_modified)
+
+        response = await self.get_list(request)
+        if response.status_code == 200:
+            await sync_to_async(set_cached_list)(cache_key, response.content)
+            add_list_validators(response, etag, last_modified)
+        response["X-Cache"] = "MISS"
+        return response
+
+    async def get_list(self, request):
+        try:
+            page, limit, sort_by, sort_order = parse_list_params(request)
+            tree_limits = parse_tree_limits(request)
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+
+        posts = Post.objects.filter(parent=None)
+
+        # Opt-in keyset pagination: no COUNT(*) and no OFFSET
+        if request.GET.get('pagination') == 'cursor':
+            return await self.get_cursor_page(request, posts, limit, sort_by, sort_order, tree_limits)
+
+        posts = posts.order_by(*get_ordering(sort_by, sort_order == 'desc'))
+        try:
+            page_posts, num_pages = await apaginate_by_page(posts, page, limit)
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+
+        rows = await aload_thread_rows(page_posts, *tree_limits)
+        data = await sync_to_async(serialize_threads, thread_sensitive=False)(*rows, request)
+
+        return json_response({
+            "posts": data,
+            "totalPages": num_pages,
+            "sort_by": sort_by,
+            "sort_order": sort_order,
+        })
+
+    async def get_cursor_page(self, request, posts, limit, sort_by, sort_order, tree_limits):
+        try:
+            page_posts, next_cursor, prev_cursor = await apaginate_by_cursor(
+                posts, sort_by, sort_order, limit, request.GET.get('cursor')
+            )
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+
+        rows = await aload_thread_rows(page_posts, *tree_limits)
+        data = await sync_to_async(serialize_threads, thread_sensitive=False)(*rows, request)
+
+        return json_response({
+            "posts": data,
+            "next": next_cursor,
+            "prev": prev_cursor,
+            # Approximate, from planner statistics; null when unavailable
+            "totalPages": await sync_to_async(estimate_total_pages)(posts, limit),
+            "sort_by": sort_by,
+            "sort_order": sort_order,
+        })
+
+
+class AsyncPostEventsView(View):
+    async def get(self, request):
+        if broker.subscriber_count() >= settings.POSTS_EVENTS_MAX_SUBSCRIBERS:
+            return too_many_subscribers_response()
+
+        # Subscribe before reading missed posts so that nothing falls in between
+        subscription = broker.subscribe(asyncio.get_running_loop())
+        missed = await sync_to_async(missed_events)(request.headers.get("Last-Event-ID"))
+        return events_response(aiter_events(subscription, missed))
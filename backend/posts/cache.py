@@ -0,0 +1,49 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import quote_etag
+from .models import ChangeSequence
+from .metrics import list_cache_requests
+
+
+def get_cache():
+    return caches[settings.POSTS_LIST_CACHE]
+
+
+# Function to invalidate every cached list page and HTTP validator, once the
+# current transaction commits (so no reader sees the new version with old data).
+# Both are derived from ChangeSequence, which every worker reads from the database:
+# a version kept in a per-process cache (locmem) would leave other workers serving
+# their old pages under the new ETag
+def bump_list_version():
+    transaction.on_commit(ChangeSequence.bump)
+
+
+def _params_digest(request, params):
+    parts = [request.scheme, request.get_host()]
+    parts += [f"{name}={request.GET.get(name, '')}" for name in params]
+    return hashlib.sha256("&".join(parts).encode("utf-8")).hexdigest()
+
+
+# Function to build the cache key of a list request from the change sequence and query parameters
+def list_cache_key(sequence, request, params):
+    return f"posts:list:v{sequence.value}:{_params_digest(request, params)}"
+
+
+# Function to build the ETag of a list request from the change sequence and query parameters
+def list_etag(sequence, request, params):
+    return quote_etag(f"{sequence.value}-{_params_digest(request, params)[:16]}")
+
+
+def get_cached_list(key):
+    cache = get_cache()
+    content = cache.get(key)
+    # Exposed on /api/posts/metrics/ (per process, no extra cache round trip)
+    list_cache_requests.inc(result="hit" if content is not None else "miss")
+    return content
+
+
+def set_cached_list(key, content):
+    get_cache().set(key, content, timeout=settings.POSTS_LIST_CACHE_TIMEOUT)
+
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel used by the LISTEN/NOTIFY bridge
+NOTIFY_CHANNEL = "posts_events"
+
+
+# Bounded queue of events for one client; closed when the client falls too far behind.
+# Async subscribers pass their event loop and get an asyncio queue fed thread-safely.
+class Subscription:
+    def __init__(self, maxsize, loop=None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize) if loop else queue.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def put(self, event):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._offer, event)
+        else:
+            self._offer(event)
+
+    def _offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            # The client reconnects with Last-Event-ID and catches up from the database
+            self.closed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# In-process pub/sub of post events
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, loop=None):
+        subscription = Subscription(settings.POSTS_EVENTS_QUEUE_SIZE, loop)
+        with self._lock:
+            self._subscribers.add(subscription)
+        if settings.POSTS_EVENTS_BACKEND == "postgres":
+            start_listener()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put(event)
+            except RuntimeError:
+                # The event loop of an async subscriber is already closed
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+broker = Broker()
+
+
+# Function to build the compact event of a new post
+def post_event(post):
+    return {"id": post.id, "parent_id": post.parent_id, "thread_root_id": post.thread_root_id}
+
+
+# Function to announce a new post to subscribers once the current transaction commits
+def publish_post_created(post):
+    event = post_event(post)
+    if settings.POSTS_EVENTS_BACKEND == "postgres":
+        # NOTIFY is transactional: every worker's listener receives it after commit
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, json.dumps(event)])
+    else:
+        transaction.on_commit(lambda: broker.publish(event))
+
+
+# Function to load the posts created after Last-Event-ID, so a reconnecting client misses nothing
+def missed_events(last_event_id):
+    try:
+        last_id = int(last_event_id)
+    except (TypeError, ValueError):
+        return []
+    posts = (
+        Post.objects.filter(id__gt=last_id)
+        .order_by("id")
+        .values("id", "parent_id", "thread_root_id")[:settings.POSTS_EVENTS_REPLAY_LIMIT]
+    )
+    return list(posts)
+
+
+# Function to format one Server-Sent Events message
+def format_event(event):
+    return f"id: {event['id']}\nevent: post_created\ndata: {json.dumps(event)}\n\n"
+
+
+# Generator of SSE messages for one subscription, with keep-alive comments while idle
+def iter_events(subscription, missed=()):
+    try:
+        yield "retry: 3000\n\n"
+        last_id = 0
+        for event in missed:
+            last_id = event["id"]
+            yield format_event(event)
+        while not subscription.closed:
+            event = subscription.get(settings.POSTS_EVENTS_HEARTBEAT)
+            if event is None:
+                yield ": keep-alive\n\n"
+            elif event["id"] > last_id:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+# Async variant of iter_events() for ASGI
+async def aiter_events(subscription, missed=()):
+    try:
+        yield "retry: 3000\n\n"
+        last_id = 0
+        for event in missed:
+            last_id = event["id"]
+            yield format_event(event)
+        while not subscription.closed:
+            event = await subscription.aget(settings.POSTS_EVENTS_HEARTBEAT)
+            if event is None:
+                yield ": keep-alive\n\n"
+            elif event["id"] > last_id:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+# Postgres LISTEN/NOTIFY bridge: one thread per process forwards notifications to the local broker
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name="posts-events-listener", daemon=True)
+            _listener.start()
+
+
+def _listen():
+    # The thread gets its own database connection, kept in autocommit mode
+    try:
+        connection.ensure_connection()
+        raw = connection.connection
+        raw.autocommit = True
+        with raw.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        while True:
+            if select.select([raw], [], [], settings.POSTS_EVENTS_HEARTBEAT) == ([], [], []):
+                continue
+            raw.poll()
+            while raw.notifies:
+                notify = raw.notifies.pop(0)
+                broker.publish(json.loads(notify.payload))
+    except Exception:
+        logger.exception("Posts events listener stopped")
+    finally:
+        connection.close()
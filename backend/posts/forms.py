@@ -1,26 +1,27 @@
+import logging
 from django import forms
-from captcha.fields import CaptchaField
-import bleach
+from django.conf import settings
+from captcha_api.pool import PooledCaptchaField
+from captcha_api.signed import SignedCaptchaField
 import re
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
+from .sanitizer import sanitize
 
-allowed_tags = ["a", "code", "i", "strong"]
-allowed_attrs = {
-    "a": ["href", "title"],
-}
+USERNAME_RE = re.compile(r"[A-Za-z0-9]+")
 url_validator = URLValidator()
+logger = logging.getLogger(__name__)
 
 class PostFormWithCaptcha(forms.Form):
     username = forms.CharField(max_length=150)
     email = forms.EmailField()
     homepage_url = forms.URLField(required=False)
     text_html = forms.CharField(widget=forms.Textarea)
-    captcha = CaptchaField()
+    captcha = SignedCaptchaField() if settings.CAPTCHA_MODE == "signed" else PooledCaptchaField()
 
     def clean_username(self):
         username = self.cleaned_data["username"]
-        if not re.fullmatch(r"[A-Za-z0-9]+", username):
+        if not USERNAME_RE.fullmatch(username):
             raise forms.ValidationError("username must contain only latin letters and digits")
         return username
 
@@ -35,18 +36,8 @@ class PostFormWithCaptcha(forms.Form):
 
     def clean_text_html(self):
         text = self.cleaned_data["text_html"]
-        
-        # Preserve newlines and spacing by converting them to <br> tags
-        # Handle multiple consecutive newlines properly
-        import re
-        
-        # Convert multiple consecutive newlines to preserve paragraph breaks
-        # Two or more newlines should create more spacing
-        text = re.sub(r'\n{3,}', '<br><br><br>', text)  # 3+ newlines become 3 br tags
-        text = re.sub(r'\n\n', '<br><br>', text)  # 2 newlines become 2 br tags
-        text = text.replace('\n', '<br>')  # Single newlines become single br tags
-        
-        # Clean the HTML with bleach, allowing br tags and our allowed tags
-        cleaned = bleach.clean(text, tags=allowed_tags + ['br'], attributes=allowed_attrs, strip=True)
-        print(f"Text after cleaning: {repr(cleaned)}")
+
+        # Convert newlines to <br> and clean the HTML with the shared allow-list
+        cleaned = sanitize(text)
+        logger.debug("Text after cleaning: %r", cleaned)
         return cleaned
@@ -0,0 +1,91 @@
+import hashlib
+import io
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# Output formats supported by render_image() and their MIME types
+OUTPUT_FORMATS = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'PNG': 'image/png',
+}
+ALPHA_FORMATS = {'WEBP', 'PNG'}
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+EXIF_ORIENTATION = 0x0112
+
+
+# Function to read the image engine settings (resolved in the web process, so
+# render_image() can run in a worker without Django configured)
+def image_options():
+    output_format = settings.POSTS_IMAGE_FORMAT.upper()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported POSTS_IMAGE_FORMAT: {settings.POSTS_IMAGE_FORMAT}")
+
+    return {
+        'size': tuple(settings.POSTS_THUMBNAIL_SIZE),
+        'format': output_format,
+        'quality': settings.POSTS_IMAGE_QUALITY,
+        'background': tuple(settings.POSTS_IMAGE_BACKGROUND),
+    }
+
+
+# Function to fingerprint the image options: the same original rendered with the
+# same key gives the same output, so it can be reused
+def render_key(options=None):
+    options = options or image_options()
+    return hashlib.sha256(repr(sorted(options.items())).encode()).hexdigest()[:16]
+
+
+# Function to resize and re-encode image bytes; returns (bytes, content_type)
+def render_image(data, options=None):
+    options = options or image_options()
+    width, height = options['size']
+    output_format = options['format']
+
+    img = Image.open(io.BytesIO(data))
+
+    # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding (the
+    # largest reduction that still covers the target box, in DCT space)
+    orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    img.draft(img.mode, (width, height))
+
+    # Apply the EXIF orientation; the rotated image already has the target box
+    img = ImageOps.exif_transpose(img)
+    width, height = options['size']
+
+    if img.width > width or img.height > height:
+        # Proportional resizing, using reduce() for the bulk of the downscale
+        img.thumbnail((width, height), reducing_gap=2.0)
+
+    img = _convert_mode(img, output_format, options['background'])
+
+    image_temp = io.BytesIO()
+    img.save(image_temp, format=output_format, **_save_options(output_format, options['quality']))
+    return image_temp.getvalue(), OUTPUT_FORMATS[output_format]
+
+
+def _convert_mode(img, output_format, background):
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+    if not has_alpha:
+        return img if img.mode in ('RGB', 'L') else img.convert('RGB')
+    if output_format in ALPHA_FORMATS:
+        return img.convert('RGBA')
+
+    # Composite transparent pixels onto the background instead of dropping alpha
+    rgba = img.convert('RGBA')
+    flattened = Image.new('RGB', rgba.size, background)
+    flattened.paste(rgba, mask=rgba.getchannel('A'))
+    return flattened
+
+
+def _save_options(output_format, quality):
+    if output_format == 'JPEG':
+        return {'quality': quality, 'optimize': True, 'progressive': True}
+    if output_format == 'WEBP':
+        return {'quality': quality, 'method': 4}
+    return {'optimize': False, 'compress_level': 6}
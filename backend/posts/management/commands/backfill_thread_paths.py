@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.cache import bump_list_version
+from posts.threads import backfill_thread_paths
+
+
+class Command(BaseCommand):
+    help = "Fill thread_root, path and depth for existing posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = backfill_thread_paths(Post, options["batch_size"])
+        bump_list_version()
+        self.stdout.write(self.style.SUCCESS(f"Backfilled thread paths for {updated} posts."))
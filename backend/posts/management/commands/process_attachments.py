@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from posts.models import FileForPost
+from posts.processing import process_attachment
+
+
+class Command(BaseCommand):
+    help = "Process pending image attachments, including jobs left behind by a stopped worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=300,
+            help="Seconds after which an attachment stuck in 'processing' is retried.",
+        )
+
+    def handle(self, *args, **options):
+        stale_before = timezone.now() - timedelta(seconds=options["stale_after"])
+        statuses = (FileForPost.STATUS_PENDING, FileForPost.STATUS_PROCESSING)
+        queue = FileForPost.objects.filter(
+            Q(status=FileForPost.STATUS_PENDING)
+            | Q(status=FileForPost.STATUS_PROCESSING, updated_at__lt=stale_before)
+        ).order_by("id")
+
+        processed = 0
+        while True:
+            ids = list(queue.values_list("id", flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            for record_id in ids:
+                if process_attachment(record_id, statuses):
+                    processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} attachments."))
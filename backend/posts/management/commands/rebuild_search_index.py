@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from posts.models import Post
+from posts.search import index_posts, is_available
+
+
+class Command(BaseCommand):
+    help = "Index the text and username of every post for search (posts created before the index existed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError("Search is only available on PostgreSQL and SQLite.")
+        batch_size = options["batch_size"]
+
+        indexed = 0
+        batch = []
+        for row in Post.objects.order_by("id").values_list("id", "username", "text_html").iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self.index_batch(batch)
+                indexed += len(batch)
+                batch = []
+        self.index_batch(batch)
+        indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} posts for search."))
+
+    def index_batch(self, batch):
+        with transaction.atomic():
+            index_posts(batch)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.cache import bump_list_version
+from posts.threads import recount_replies
+
+
+class Command(BaseCommand):
+    help = "Recompute reply_count, descendant_count and last_activity_at of every post (run backfill_thread_paths first)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Threads per batch.")
+
+    def handle(self, *args, **options):
+        fixed = recount_replies(Post, options["batch_size"])
+        bump_list_version()
+        self.stdout.write(self.style.SUCCESS(f"Recounted replies, fixed {fixed} posts."))
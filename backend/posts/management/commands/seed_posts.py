@@ -0,0 +1,271 @@
+import datetime
+import io
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from PIL import Image
+from posts.models import Post, FileForPost, Blob, path_segment
+from posts.storage import get_blob_store
+from posts.cache import bump_list_version
+from posts.search import index_posts
+
+WORDS = (
+    "the comment thread reply thanks agree link code python django server page "
+    "image works fine error again later update version please check this"
+).split()
+
+
+# Function to build a pool of comment bodies, already in the stored (sanitized) form
+def sample_texts(rng, count=200):
+    texts = []
+    for _ in range(count):
+        paragraphs = []
+        for _ in range(rng.choice([1, 1, 1, 2, 3, 6])):
+            words = rng.choices(WORDS, k=rng.randint(5, 40))
+            if rng.random() < 0.1:
+                words.insert(rng.randrange(len(words)), '<a href="https://example.com/page">link</a>')
+            elif rng.random() < 0.1:
+                words.insert(rng.randrange(len(words)), "<code>print(value)</code>")
+            paragraphs.append(" ".join(words).capitalize() + ".")
+        texts.append("<br><br>".join(paragraphs))
+    return texts
+
+
+# Function to store a pool of synthetic attachments; returns (sha256, size, filename, content_type) tuples
+def sample_files(rng, count):
+    files = []
+    for i in range(count):
+        if i % 3 == 2:
+            data = " ".join(rng.choices(WORDS, k=rng.randint(50, 2000))).encode("utf-8")
+            filename, content_type = f"notes{i}.txt", "text/plain"
+        else:
+            buffer = io.BytesIO()
+            Image.effect_noise((320, 240), rng.randint(8, 64)).convert("RGB").save(buffer, "JPEG", quality=80)
+            data = buffer.getvalue()
+            filename, content_type = f"image{i}.jpg", "image/jpeg"
+        files.append((get_blob_store().save(data), len(data), filename, content_type))
+    return files
+
+
+# Post being generated; attributes are named after the columns of posts_post
+class SeedPost:
+    __slots__ = [field.column for field in Post._meta.concrete_fields]
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+
+# Function to format one value for COPY ... FROM STDIN (text format)
+def copy_value(value):
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+# Function to insert rows (tuples in column order) with one statement per batch, or with
+# PostgreSQL COPY (psycopg2 or psycopg 3). The ORM is bypassed: bulk_create() spends
+# most of its time preparing every field and would overwrite created_at/updated_at.
+def insert_rows(model, columns, rows, use_copy):
+    table = connection.ops.quote_name(model._meta.db_table)
+    names = ", ".join(connection.ops.quote_name(column) for column in columns)
+    with connection.cursor() as cursor:
+        if not use_copy:
+            placeholders = ", ".join(["%s"] * len(columns))
+            cursor.executemany(f"INSERT INTO {table} ({names}) VALUES ({placeholders})", rows)
+            return
+
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(copy_value(value) for value in row) + "\n")
+        buffer.seek(0)
+        sql = f"COPY {table} ({names}) FROM STDIN"
+        raw = cursor.cursor
+        if hasattr(raw, "copy_expert"):
+            raw.copy_expert(sql, buffer)
+        else:
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic comment threads in bulk: power-law thread sizes, deep reply chains "
+        "and optional attachments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=1000, help="Top-level posts to create.")
+        parser.add_argument("--alpha", type=float, default=1.2,
+                            help="Power-law exponent of thread sizes (smaller: more huge threads).")
+        parser.add_argument("--max-replies", type=int, default=10000, help="Largest thread size.")
+        parser.add_argument("--chain", type=float, default=0.3,
+                            help="Probability that a reply answers the latest post of its thread (deep chains).")
+        parser.add_argument("--max-depth", type=int, default=100, help="Deepest reply level.")
+        parser.add_argument("--users", type=int, default=5000, help="Distinct authors.")
+        parser.add_argument("--days", type=int, default=365, help="The posts are spread over this many days.")
+        parser.add_argument("--files-ratio", type=float, default=0.0, help="Share of posts with attachments.")
+        parser.add_argument("--distinct-files", type=int, default=30, help="Distinct attachment payloads.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per insert.")
+        parser.add_argument("--no-copy", action="store_true", help="Use batched INSERTs on PostgreSQL too.")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options["threads"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--threads and --batch-size must be positive.")
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.texts = sample_texts(self.rng)
+        self.files = sample_files(self.rng, options["distinct_files"]) if options["files_ratio"] > 0 else []
+        self.file_refs = {}
+        self.use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+
+        # Ids are assigned here, so paths can be built before the rows are inserted
+        self.next_post_id = (Post.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+        self.next_file_id = (FileForPost.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+        now = timezone.now()
+        start = now - datetime.timedelta(days=options["days"])
+        step = (now - start) / options["threads"]
+
+        started = time.perf_counter()
+        posts, files = [], []
+        total_posts = total_files = 0
+        for i in range(options["threads"]):
+            thread = self.build_thread(start + step * i, now)
+            posts.extend(thread)
+            files.extend(self.build_files(thread))
+            if len(posts) >= options["batch_size"]:
+                self.insert(posts, files)
+                total_posts += len(posts)
+                total_files += len(files)
+                posts, files = [], []
+        self.insert(posts, files)
+        total_posts += len(posts)
+        total_files += len(files)
+
+        self.count_file_references()
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Post, FileForPost]):
+                cursor.execute(sql)
+        bump_list_version()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {total_posts} posts in {options['threads']} threads and {total_files} attachments "
+            f"in {elapsed:.1f}s ({total_posts / elapsed:.0f} posts/s)."
+        ))
+
+    # Function to generate one thread in memory, with its counters already computed
+    def build_thread(self, created_at, now):
+        rng, options = self.rng, self.options
+        size = min(options["max_replies"], int(rng.paretovariate(options["alpha"])) - 1)
+
+        root = self.new_post(None, created_at)
+        thread = [root]
+        for _ in range(size):
+            if rng.random() < options["chain"]:
+                parent = thread[-1]
+            else:
+                parent = rng.choice(thread)
+            if parent.depth >= options["max_depth"]:
+                parent = root
+            # Replies follow their parent after minutes to days
+            delay = datetime.timedelta(seconds=rng.expovariate(1 / 3600))
+            thread.append(self.new_post(parent, min(parent.created_at + delay, now)))
+
+        # Children always come after their parent, so one reverse pass fills the counters
+        by_id = {post.id: post for post in thread}
+        for post in reversed(thread):
+            parent = by_id.get(post.parent_id)
+            if parent is not None:
+                parent.reply_count += 1
+                parent.descendant_count += post.descendant_count + 1
+                parent.last_activity_at = max(parent.last_activity_at, post.last_activity_at)
+        return thread
+
+    def new_post(self, parent, created_at):
+        rng = self.rng
+        post_id = self.next_post_id
+        self.next_post_id += 1
+
+        # A few authors write most of the posts
+        user = min(self.options["users"], int(rng.paretovariate(1.1))) - 1
+        return SeedPost(
+            id=post_id,
+            username=f"user{user}",
+            email=f"user{user}@example.com",
+            homepage_url="https://example.com" if rng.random() < 0.2 else None,
+            text_html=rng.choice(self.texts),
+            parent_id=parent.id if parent else None,
+            thread_root_id=parent.thread_root_id if parent else post_id,
+            path=(parent.path if parent else "") + path_segment(post_id),
+            depth=parent.depth + 1 if parent else 0,
+            last_activity_at=created_at,
+            created_at=created_at,
+            updated_at=created_at,
+            reply_count=0,
+            descendant_count=0,
+        )
+
+    def build_files(self, thread):
+        if not self.files:
+            return []
+        records = []
+        for post in thread:
+            if self.rng.random() >= self.options["files_ratio"]:
+                continue
+            for sha256, size, filename, content_type in self.rng.sample(self.files, self.rng.choice([1, 1, 2])):
+                records.append({
+                    "id": self.next_file_id,
+                    "post_id": post.id,
+                    "sha256": sha256,
+                    "size": size,
+                    "filename": filename,
+                    "content_type": content_type,
+                    "status": FileForPost.STATUS_READY,
+                    "original_sha256": "",
+                    "render_key": "",
+                    "error": "",
+                    "updated_at": post.created_at,
+                })
+                self.next_file_id += 1
+                self.file_refs[sha256] = self.file_refs.get(sha256, 0) + 1
+        return records
+
+    def insert(self, posts, files):
+        if not posts:
+            return
+        # COPY takes datetimes as text; the other backends get them adapted as the ORM would
+        adapt = str if self.use_copy else connection.ops.adapt_datetimefield_value
+        post_columns = SeedPost.__slots__
+        file_columns = [field.column for field in FileForPost._meta.concrete_fields]
+        post_rows = [
+            tuple(adapt(value) if isinstance(value, datetime.datetime) else value
+                  for value in (getattr(post, column) for column in post_columns))
+            for post in posts
+        ]
+        file_rows = [
+            tuple(adapt(value) if isinstance(value, datetime.datetime) else value
+                  for value in (record[column] for column in file_columns))
+            for record in files
+        ]
+        with transaction.atomic():
+            insert_rows(Post, post_columns, post_rows, self.use_copy)
+            if file_rows:
+                insert_rows(FileForPost, file_columns, file_rows, self.use_copy)
+            index_posts((post.id, post.username, post.text_html) for post in posts)
+
+    # Function to add the new attachments to the reference counts of their blobs
+    def count_file_references(self):
+        for sha256, count in self.file_refs.items():
+            if not Blob.objects.filter(sha256=sha256).update(ref_count=F("ref_count") + count):
+                Blob.objects.create(sha256=sha256, ref_count=count)
+        # Payloads that no post drew are not kept
+        for sha256, *_ in self.files:
+            if sha256 not in self.file_refs and not Blob.objects.filter(sha256=sha256).exists():
+                get_blob_store().delete(sha256)
@@ -0,0 +1,173 @@
+import threading
+import time
+from contextvars import ContextVar
+
+# In-process metrics rendered in the Prometheus text format (GET /api/posts/metrics/).
+# Every worker process keeps its own numbers.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+NODE_BUCKETS = (0, 1, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+# Function to escape a label value
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Function to format a label set, e.g. {endpoint="api/posts/get/",method="GET"}
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in [*zip(names, values), *extra]]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Monotonic counter with a fixed set of labels
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{format_labels(self.labels, key)} {value}"
+
+
+# Histogram with cumulative buckets, as Prometheus expects them
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then the sum and the total count
+                counts = self._values[key] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in values:
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket{format_labels(self.labels, key, [('le', bound)])} {count}"
+            yield f"{self.name}_bucket{format_labels(self.labels, key, [('le', '+Inf')])} {counts[-1]}"
+            yield f"{self.name}_sum{format_labels(self.labels, key)} {counts[-2]}"
+            yield f"{self.name}_count{format_labels(self.labels, key)} {counts[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    "http_requests_total", "Requests by endpoint, method and status.", ("endpoint", "method", "status"),
+))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time until the response is returned (streams excluded).",
+    ("endpoint", "method"),
+))
+request_queries = registry.register(Histogram(
+    "http_request_db_queries", "Database queries per request.", ("endpoint", "method"), QUERY_BUCKETS,
+))
+request_query_time = registry.register(Histogram(
+    "http_request_db_seconds", "Database time per request.", ("endpoint", "method"),
+))
+serialized_nodes = registry.register(Histogram(
+    "posts_serialized_nodes", "Posts serialized per request.", ("endpoint",), NODE_BUCKETS,
+))
+image_processing = registry.register(Histogram(
+    "posts_image_processing_seconds", "Pillow time per image.", ("mode",),
+))
+list_cache_requests = registry.register(Counter(
+    "posts_list_cache_requests_total", "List cache lookups by result (hit or miss).", ("result",),
+))
+
+
+# Counters of the request being handled; shared with the worker threads of
+# sync_to_async, which run in a copy of the request's context
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.nodes = 0
+
+
+request_stats = ContextVar("posts_request_stats", default=None)
+
+
+# Function to count posts serialized during the current request
+def count_node(count=1):
+    stats = request_stats.get()
+    if stats is not None:
+        stats.nodes += count
+
+
+# Database execute wrapper, installed on every connection (see apps.py)
+def count_query(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+# Function to record a finished request
+def observe_request(request, response, stats, duration):
+    match = getattr(request, "resolver_match", None)
+    # The route pattern keeps the label set small (no ids in it)
+    endpoint = match.route if match else "unmatched"
+    requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    request_duration.observe(duration, endpoint=endpoint, method=request.method)
+    request_queries.observe(stats.queries, endpoint=endpoint, method=request.method)
+    request_query_time.observe(stats.query_time, endpoint=endpoint, method=request.method)
+    if stats.nodes:
+        serialized_nodes.observe(stats.nodes, endpoint=endpoint)
@@ -0,0 +1,39 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .metrics import RequestStats, request_stats, observe_request
+
+
+# Middleware that records latency, database queries and serialized posts of every
+# request (posts.metrics). Works in front of both sync and async views.
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        observe_request(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        observe_request(request, response, stats, time.perf_counter() - started)
+        return response
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from posts.threads import backfill_thread_paths
+
+
+def fill_thread_paths(apps, schema_editor):
+    # Same walk as the backfill_thread_paths command; replies need the path of their parent
+    backfill_thread_paths(apps.get_model('posts', 'Post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_fileforpost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='path',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='thread_root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_posts', to='posts.post'),
+        ),
+        migrations.RunPython(fill_thread_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['thread_root', 'path'], name='post_thread_path_idx'),
+        ),
+    ]
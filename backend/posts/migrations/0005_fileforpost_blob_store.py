@@ -0,0 +1,64 @@
+import base64
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def move_to_blob_store(apps, schema_editor):
+    from posts.storage import get_blob_store
+
+    FileForPost = apps.get_model('posts', 'FileForPost')
+    store = get_blob_store()
+    batch = []
+    for record in FileForPost.objects.only('id', 'file_base64').iterator(chunk_size=BATCH_SIZE):
+        data = base64.b64decode(record.file_base64 or '')
+        record.sha256 = store.save(data)
+        record.size = len(data)
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            FileForPost.objects.bulk_update(batch, ['sha256', 'size'])
+            batch = []
+    FileForPost.objects.bulk_update(batch, ['sha256', 'size'])
+
+
+def restore_from_blob_store(apps, schema_editor):
+    from posts.storage import get_blob_store
+
+    FileForPost = apps.get_model('posts', 'FileForPost')
+    store = get_blob_store()
+    batch = []
+    for record in FileForPost.objects.only('id', 'sha256').iterator(chunk_size=BATCH_SIZE):
+        with store.open(record.sha256) as blob:
+            record.file_base64 = base64.b64encode(blob.read()).decode('utf-8')
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            FileForPost.objects.bulk_update(batch, ['file_base64'])
+            batch = []
+    FileForPost.objects.bulk_update(batch, ['file_base64'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_thread_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileforpost',
+            name='sha256',
+            field=models.CharField(db_index=True, default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='fileforpost',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(move_to_blob_store, restore_from_blob_store),
+        migrations.RemoveField(
+            model_name='fileforpost',
+            name='file_base64',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_fileforpost_blob_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileforpost',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='fileforpost',
+            name='original_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='fileforpost',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='ready', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='fileforpost',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:53
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+from posts.threads import recount_replies
+
+
+def count_replies(apps, schema_editor):
+    # Same computation as the recount_replies command, from the thread paths of 0004
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(last_activity_at=F('created_at'))
+    recount_replies(Post)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_changesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='descendant_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_replies, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['last_activity_at', 'id'], name='post_top_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['reply_count', 'id'], name='post_top_reply_count_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_post_reply_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['id'], name='post_top_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['username', 'id'], name='post_top_username_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['email', 'id'], name='post_top_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['created_at', 'id'], name='post_top_created_at_idx'),
+        ),
+    ]
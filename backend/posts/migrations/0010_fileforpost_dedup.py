@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:06
+
+from collections import Counter
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    # Same rule as FileForPost.held_digests(); existing renditions get no render_key,
+    # so they are not reused
+    FileForPost = apps.get_model('posts', 'FileForPost')
+    Blob = apps.get_model('posts', 'Blob')
+    counts = Counter()
+    for sha256, original_sha256, status in FileForPost.objects.values_list('sha256', 'original_sha256', 'status').iterator():
+        if sha256:
+            counts[sha256] += 1
+        if original_sha256 and status != 'ready':
+            counts[original_sha256] += 1
+    Blob.objects.bulk_create(
+        [Blob(sha256=digest, ref_count=count) for digest, count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fileforpost',
+            name='render_key',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='fileforpost',
+            index=models.Index(fields=['original_sha256', 'render_key'], name='fileforpost_rendition_idx'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+# The search index lives outside the Post model (see posts/search.py); fill it with
+# the rebuild_search_index command
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE posts_post ADD COLUMN search_vector tsvector')
+        schema_editor.execute('CREATE INDEX post_search_idx ON posts_post USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute('CREATE VIRTUAL TABLE posts_post_fts USING fts5(username, body)')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE posts_post DROP COLUMN search_vector')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_fileforpost_dedup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
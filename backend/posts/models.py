@@ -1,4 +1,15 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .storage import get_blob_store
+
+# Width of one zero-padded id segment in Post.path
+PATH_SEGMENT_WIDTH = 12
+
+
+def path_segment(post_id):
+    return str(post_id).zfill(PATH_SEGMENT_WIDTH)
 
 
 class Post(models.Model):
@@ -15,9 +26,61 @@ class Post(models.Model):
         related_name='replies'
     )
 
+    # Denormalized thread position: the top-level post of the thread and the
+    # ids from the root down to this post, so a thread is one index range scan
+    thread_root = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='thread_posts'
+    )
+    path = models.TextField(blank=True, default="")
+    depth = models.PositiveIntegerField(default=0)
+
+    # Denormalized counters, maintained by update_ancestor_counters() and the
+    # recount_replies command: direct replies, all replies below, latest post in the subtree
+    reply_count = models.PositiveIntegerField(default=0)
+    descendant_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['thread_root', 'path'], name='post_thread_path_idx'),
+            # Replies of a post in display order (tree limits and the replies endpoint)
+            models.Index(fields=['parent', 'id'], name='post_parent_id_idx'),
+            # One partial index per sortable field of the posts list (posts.pagination.SORT_FIELDS)
+            models.Index(fields=['id'], condition=models.Q(parent__isnull=True), name='post_top_id_idx'),
+            models.Index(
+                fields=['username', 'id'],
+                condition=models.Q(parent__isnull=True),
+                name='post_top_username_idx',
+            ),
+            models.Index(
+                fields=['email', 'id'],
+                condition=models.Q(parent__isnull=True),
+                name='post_top_email_idx',
+            ),
+            models.Index(
+                fields=['created_at', 'id'],
+                condition=models.Q(parent__isnull=True),
+                name='post_top_created_at_idx',
+            ),
+            models.Index(
+                fields=['last_activity_at', 'id'],
+                condition=models.Q(parent__isnull=True),
+                name='post_top_activity_idx',
+            ),
+            models.Index(
+                fields=['reply_count', 'id'],
+                condition=models.Q(parent__isnull=True),
+                name='post_top_reply_count_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.username}: {self.text_html[:30]}"
 
@@ -25,11 +88,159 @@ class Post(models.Model):
     def is_comment(self):
         return self.parent is not None
 
+    # Fill thread_root, path and depth from the parent (the post must already have an id)
+    def set_thread_position(self):
+        # A new post is the latest activity of its own subtree
+        self.last_activity_at = self.created_at
+        if self.parent is None:
+            self.thread_root_id = self.id
+            self.path = path_segment(self.id)
+            self.depth = 0
+        else:
+            self.thread_root_id = self.parent.thread_root_id
+            self.path = self.parent.path + path_segment(self.id)
+            self.depth = self.parent.depth + 1
+        self.save(update_fields=['thread_root', 'path', 'depth', 'last_activity_at'])
+
+    # Ids of all ancestors, root first, read from the materialized path
+    def ancestor_ids(self):
+        return [
+            int(self.path[start:start + PATH_SEGMENT_WIDTH])
+            for start in range(0, len(self.path) - PATH_SEGMENT_WIDTH, PATH_SEGMENT_WIDTH)
+        ]
+
+    # Count this new reply in its parent and ancestors, with atomic F() updates
+    def update_ancestor_counters(self):
+        if self.parent_id is None:
+            return
+        Post.objects.filter(id=self.parent_id).update(reply_count=F('reply_count') + 1)
+        Post.objects.filter(id__in=self.ancestor_ids()).update(
+            descendant_count=F('descendant_count') + 1,
+            # Replies committed out of order must not move the activity backwards
+            last_activity_at=Greatest(F('last_activity_at'), Value(self.created_at)),
+        )
+
 class FileForPost(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     post = models.ForeignKey('Post', on_delete=models.CASCADE, related_name='files')
-    file_base64 = models.TextField(blank=True, null=True)
+    # Bytes live in the blob store (posts.storage), addressed by their SHA-256
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
     filename = models.CharField(max_length=255)
     content_type = models.CharField(max_length=100)
 
+    # Background processing (posts.processing): the unprocessed upload waits in
+    # the blob store under original_sha256 until the file becomes ready
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_READY, db_index=True)
+    original_sha256 = models.CharField(max_length=64, blank=True, default="")
+    # Image options the file was rendered with (posts.images.render_key); with
+    # original_sha256 it finds an existing rendition of the same upload
+    render_key = models.CharField(max_length=16, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['original_sha256', 'render_key'], name='fileforpost_rendition_idx'),
+        ]
+
     def __str__(self):
         return f"File for {self.post.username}: {self.filename}"
+
+    @property
+    def is_ready(self):
+        return self.status == self.STATUS_READY
+
+    def open(self):
+        return get_blob_store().open(self.sha256)
+
+    # Blobs this record holds a reference on: the file, and the original until it is processed
+    def held_digests(self):
+        digests = [self.sha256] if self.sha256 else []
+        if self.original_sha256 and not self.is_ready:
+            digests.append(self.original_sha256)
+        return digests
+
+
+class Blob(models.Model):
+    # Reference count of a blob in the blob store, shared by every attachment with the
+    # same bytes; the bytes are deleted with the last reference
+    sha256 = models.CharField(max_length=64, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count})"
+
+    @classmethod
+    def acquire(cls, digest):
+        if cls.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(sha256=digest, ref_count=1)
+        except IntegrityError:
+            # Created concurrently
+            cls.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+
+    @classmethod
+    def release(cls, digest):
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(sha256=digest).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1:
+                cls.objects.filter(id=blob.id).update(ref_count=F('ref_count') - 1)
+                return
+            blob.delete()
+        transaction.on_commit(lambda: _delete_unreferenced(digest))
+
+    # Store bytes and take a reference on them; returns the digest
+    @classmethod
+    def store(cls, data):
+        digest = get_blob_store().save(data)
+        cls.acquire(digest)
+        return digest
+
+
+def _delete_unreferenced(digest):
+    # Skip if the same bytes were uploaded again in the meantime
+    if not Blob.objects.filter(sha256=digest).exists():
+        get_blob_store().delete(digest)
+
+
+class ChangeSequence(models.Model):
+    # Single row counting the writes that change the posts list; used as an HTTP validator
+    value = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    SINGLETON_ID = 1
+
+    @classmethod
+    def current(cls):
+        sequence = cls.objects.filter(pk=cls.SINGLETON_ID).first()
+        if sequence is None:
+            sequence, _ = cls.objects.get_or_create(pk=cls.SINGLETON_ID)
+        return sequence
+
+    @classmethod
+    async def acurrent(cls):
+        sequence = await cls.objects.filter(pk=cls.SINGLETON_ID).afirst()
+        if sequence is None:
+            sequence, _ = await cls.objects.aget_or_create(pk=cls.SINGLETON_ID)
+        return sequence
+
+    @classmethod
+    def bump(cls):
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(value=F('value') + 1, changed_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID, defaults={'value': 1})
@@ -0,0 +1,162 @@
+import base64
+import binascii
+import json
+import math
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from .models import Post
+
+# Fields the posts list can be sorted by; each has a partial (field, id) index on top-level posts
+SORT_FIELDS = ("id", "username", "email", "created_at", "last_activity_at", "reply_count")
+SORT_ORDERS = ("asc", "desc")
+
+
+# Function to validate the sorting parameters
+def check_sorting(sort_by, sort_order):
+    if sort_by not in SORT_FIELDS:
+        raise ValidationError(f"sort_by must be one of: {', '.join(SORT_FIELDS)}.")
+    if sort_order not in SORT_ORDERS:
+        raise ValidationError(f"sort_order must be one of: {', '.join(SORT_ORDERS)}.")
+
+
+# Function to build the order_by() arguments, with id as a stable tiebreaker
+def get_ordering(sort_by, descending):
+    ordering = [sort_by, "id"] if sort_by != "id" else ["id"]
+    if descending:
+        ordering = [f"-{name}" for name in ordering]
+    return ordering
+
+
+# Function to validate a page number against the number of pages; the first page always exists
+def check_page(page, num_pages):
+    if not 1 <= page <= num_pages:
+        raise ValidationError(f"page must be between 1 and {num_pages}.")
+
+
+# Function to return one page of a queryset by page number; returns (rows, num_pages)
+def paginate_by_page(queryset, page, limit):
+    paginator = Paginator(queryset, limit)
+    check_page(page, paginator.num_pages)
+    return list(paginator.page(page)), paginator.num_pages
+
+
+# Async variant of paginate_by_page()
+async def apaginate_by_page(queryset, page, limit):
+    count = await queryset.acount()
+    num_pages = max(1, math.ceil(count / limit))
+    check_page(page, num_pages)
+    offset = (page - 1) * limit
+    rows = [post async for post in queryset[offset:offset + limit]]
+    return rows, num_pages
+
+
+# Function to encode the sort key and id of a post into an opaque cursor
+def encode_cursor(post, sort_by, sort_order, direction):
+    value = getattr(post, sort_by)
+    if hasattr(value, "isoformat"):
+        # Keep full microsecond precision, unlike DjangoJSONEncoder
+        value = value.isoformat()
+
+    payload = {
+        "s": sort_by,
+        "o": sort_order,
+        "d": direction,
+        "v": value,
+        "id": post.id,
+    }
+    raw = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+# Function to decode a cursor produced by encode_cursor()
+def decode_cursor(token, sort_by, sort_order):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        field = Post._meta.get_field(sort_by)
+        value = field.to_python(payload["v"])
+        post_id = int(payload["id"])
+        direction = payload["d"]
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError, ValidationError):
+        raise ValidationError("Invalid cursor.")
+
+    if payload.get("s") != sort_by or payload.get("o") != sort_order or direction not in ("next", "prev"):
+        raise ValidationError("Cursor does not match the requested sorting.")
+
+    return value, post_id, direction
+
+
+# Function to build the keyset query of a cursor page; returns (queryset, direction)
+def cursor_page_query(queryset, sort_by, sort_order, limit, cursor=None):
+    direction = "next"
+    descending = sort_order != "asc"
+    if cursor:
+        value, post_id, direction = decode_cursor(cursor, sort_by, sort_order)
+
+        # Going backwards walks the index in the opposite order
+        after = descending if direction == "next" else not descending
+        lookup = "lt" if after else "gt"
+        if sort_by == "id":
+            condition = Q(**{f"id__{lookup}": post_id})
+        else:
+            condition = Q(**{f"{sort_by}__{lookup}": value}) | Q(**{sort_by: value, f"id__{lookup}": post_id})
+        queryset = queryset.filter(condition)
+
+    reverse = direction == "prev"
+
+    # Fetch one extra row to know whether there is another page
+    return queryset.order_by(*get_ordering(sort_by, descending != reverse))[:limit + 1], direction
+
+
+# Function to turn the rows of cursor_page_query() into (posts, next_cursor, prev_cursor)
+def cursor_page_result(rows, sort_by, sort_order, limit, cursor, direction):
+    has_more = len(rows) > limit
+    posts = rows[:limit]
+    if direction == "prev":
+        posts.reverse()
+
+    if direction == "next":
+        has_next, has_prev = has_more, cursor is not None
+    else:
+        has_next, has_prev = True, has_more
+
+    next_cursor = encode_cursor(posts[-1], sort_by, sort_order, "next") if posts and has_next else None
+    prev_cursor = encode_cursor(posts[0], sort_by, sort_order, "prev") if posts and has_prev else None
+    return posts, next_cursor, prev_cursor
+
+
+# Function to return one page of posts after/before the cursor using keyset pagination
+def paginate_by_cursor(queryset, sort_by, sort_order, limit, cursor=None):
+    query, direction = cursor_page_query(queryset, sort_by, sort_order, limit, cursor)
+    return cursor_page_result(list(query), sort_by, sort_order, limit, cursor, direction)
+
+
+# Async variant of paginate_by_cursor()
+async def apaginate_by_cursor(queryset, sort_by, sort_order, limit, cursor=None):
+    query, direction = cursor_page_query(queryset, sort_by, sort_order, limit, cursor)
+    rows = [post async for post in query]
+    return cursor_page_result(rows, sort_by, sort_order, limit, cursor, direction)
+
+
+# Function to estimate the number of rows of a queryset from planner statistics (PostgreSQL only)
+def estimate_count(queryset):
+    if connection.vendor != "postgresql":
+        return None
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+# Function to estimate the number of pages, or None when no estimate is available
+def estimate_total_pages(queryset, limit):
+    count = estimate_count(queryset)
+    if count is None:
+        return None
+    return max(1, math.ceil(count / limit))
@@ -0,0 +1,268 @@
+import hashlib
+import logging
+import threading
+import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import FileForPost, Blob
+from .storage import get_blob_store
+from .utils import check_file_size, check_image, handle_uploaded_file
+from .images import image_options, render_image, render_key
+from .cache import bump_list_version
+from .metrics import image_processing
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+# Function to lazily create the bounded process pool for image work
+def get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.POSTS_IMAGE_WORKERS)
+            _slots = threading.BoundedSemaphore(settings.POSTS_IMAGE_MAX_QUEUED)
+    return _executor
+
+
+# Function to validate, store and (in sync mode) process an uploaded file without
+# writing to the database; returns an unsaved FileForPost that already holds
+# references on its blobs (see save_attachments() and discard_attachments())
+def prepare_attachment(file):
+    if not file.content_type.startswith('image'):
+        sha256, size, content_type = handle_uploaded_file(file)
+        Blob.acquire(sha256)
+        return FileForPost(sha256=sha256, size=size, filename=file.name, content_type=content_type)
+
+    check_file_size(file)
+    check_image(file)
+    # Uploads streamed by PostUploadHandler are already hashed and stored
+    original_sha256 = getattr(file, 'sha256', None) or hashlib.sha256(file.read()).hexdigest()
+    key = render_key()
+
+    # The same image was already processed with the same options: skip Pillow
+    rendition = acquire_rendition(original_sha256, key)
+    if rendition is None and settings.POSTS_IMAGE_PROCESSING == 'background':
+        # Processed after commit; the original waits in the blob store. The reference
+        # comes first, so that a concurrent release cannot delete the bytes after the check
+        Blob.acquire(original_sha256)
+        if not get_blob_store().exists(original_sha256):
+            file.seek(0)
+            get_blob_store().save(file.read())
+        return FileForPost(
+            sha256="",
+            original_sha256=original_sha256,
+            size=0,
+            filename=file.name,
+            content_type=file.content_type,
+            status=FileForPost.STATUS_PENDING,
+        )
+    if rendition is None:
+        file.seek(0)
+        (data, content_type), seconds = timed_render(file.read())
+        image_processing.observe(seconds, mode="request")
+        rendition = {"sha256": Blob.store(data), "size": len(data), "content_type": content_type}
+
+    return FileForPost(
+        sha256=rendition["sha256"],
+        size=rendition["size"],
+        filename=file.name,
+        content_type=rendition["content_type"],
+        original_sha256=original_sha256,
+        render_key=key,
+    )
+
+
+# Function to prepare every file of a request; on a validation error the files
+# prepared so far are discarded
+def prepare_attachments(files):
+    records = []
+    try:
+        for file in files:
+            records.append(prepare_attachment(file))
+    except BaseException:
+        discard_attachments(records)
+        raise
+    return records
+
+
+# Function to insert prepared attachments with one query (inside the post's transaction)
+def save_attachments(post, records):
+    for record in records:
+        record.post = post
+    FileForPost.objects.bulk_create(records)
+
+    # Only hand the jobs to the pool once the rows are visible to other connections
+    for record in records:
+        if record.status == FileForPost.STATUS_PENDING:
+            transaction.on_commit(partial(submit, record.id))
+    return records
+
+
+# Function to drop the blob references of attachments that were never saved
+def discard_attachments(records):
+    for record in records:
+        for digest in record.held_digests():
+            Blob.release(digest)
+
+
+# Function to render an image and measure the Pillow time; runs in the worker
+# process, so the duration travels back with the result
+def timed_render(data, options=None):
+    started = time.perf_counter()
+    result = render_image(data, options)
+    return result, time.perf_counter() - started
+
+
+# Function to find a ready rendition of an original image; returns its sha256, size
+# and content_type, or None
+def find_rendition(original_sha256, key):
+    return (
+        FileForPost.objects.filter(original_sha256=original_sha256, render_key=key, status=FileForPost.STATUS_READY)
+        .exclude(sha256="")
+        .values("sha256", "size", "content_type")
+        .first()
+    )
+
+
+# Function to take a reference on a ready rendition of an original image; returns it as
+# find_rendition() does, or None if there is none or its bytes were deleted (its last
+# reference was released between the lookup and the acquire)
+def acquire_rendition(original_sha256, key):
+    rendition = find_rendition(original_sha256, key)
+    if rendition is None:
+        return None
+    # Once acquired, the bytes are no longer deleted: check them only now
+    Blob.acquire(rendition["sha256"])
+    if get_blob_store().exists(rendition["sha256"]):
+        return rendition
+    Blob.release(rendition["sha256"])
+    return None
+
+
+# Function to hand a pending attachment to the process pool
+def submit(record_id):
+    executor = get_executor()
+
+    # When the pool is saturated, the attachment stays pending: a worker takes it when a slot
+    # frees up (submit_pending()), or the process_attachments command does. Rendering it here
+    # would make the create request wait for Pillow
+    if not _slots.acquire(blocking=False):
+        return
+
+    original_sha256 = claim(record_id)
+    if original_sha256 is None:
+        _slots.release()
+        return
+
+    try:
+        with get_blob_store().open(original_sha256) as blob:
+            data = blob.read()
+        future = executor.submit(timed_render, data, image_options())
+    except Exception as e:
+        _slots.release()
+        fail(record_id, e)
+        return
+    future.add_done_callback(lambda f: _on_done(record_id, f))
+
+
+def _on_done(record_id, future):
+    # Runs in the pool's management thread, which needs its own DB connection
+    try:
+        try:
+            (data, content_type), seconds = future.result()
+        except Exception as e:
+            fail(record_id, e)
+        else:
+            image_processing.observe(seconds, mode="pool")
+            complete(record_id, data, content_type)
+    finally:
+        _slots.release()
+        try:
+            submit_pending()
+        except Exception:
+            logger.exception("Could not submit a pending attachment")
+        connection.close()
+
+
+# Function to hand the oldest pending attachment, if any, to the pool
+def submit_pending():
+    record_id = (
+        FileForPost.objects.filter(status=FileForPost.STATUS_PENDING)
+        .order_by("id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    if record_id is not None:
+        submit(record_id)
+
+
+# Function to mark a pending attachment as processing; returns its original digest,
+# or None if another worker already claimed it
+def claim(record_id, statuses=(FileForPost.STATUS_PENDING,)):
+    claimed = FileForPost.objects.filter(id=record_id, status__in=statuses).update(
+        status=FileForPost.STATUS_PROCESSING,
+        updated_at=timezone.now(),
+    )
+    if not claimed:
+        return None
+    return FileForPost.objects.values_list("original_sha256", flat=True).get(id=record_id)
+
+
+# Function to store the processed image and mark the attachment as ready; the
+# record's reference moves from the original to the processed image
+def complete(record_id, data, content_type):
+    original_sha256 = FileForPost.objects.filter(id=record_id).values_list("original_sha256", flat=True).first()
+    if original_sha256 is None:
+        # Deleted while processing: its references went with it
+        return
+
+    sha256 = Blob.store(data)
+    updated = FileForPost.objects.filter(id=record_id).update(
+        sha256=sha256,
+        size=len(data),
+        content_type=content_type,
+        render_key=render_key(),
+        status=FileForPost.STATUS_READY,
+        error="",
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        # Deleted since the lookup: nothing holds the processed image
+        Blob.release(sha256)
+        return
+    Blob.release(original_sha256)
+    bump_list_version()
+
+
+# Function to mark the attachment as failed
+def fail(record_id, error):
+    FileForPost.objects.filter(id=record_id).update(
+        status=FileForPost.STATUS_FAILED,
+        error=str(error),
+        updated_at=timezone.now(),
+    )
+    bump_list_version()
+
+
+# Function to process one attachment synchronously (fallback and management command)
+def process_attachment(record_id, statuses=(FileForPost.STATUS_PENDING,)):
+    original_sha256 = claim(record_id, statuses)
+    if original_sha256 is None:
+        return False
+
+    try:
+        with get_blob_store().open(original_sha256) as blob:
+            (data, content_type), seconds = timed_render(blob.read())
+    except Exception as e:
+        fail(record_id, e)
+    else:
+        image_processing.observe(seconds, mode="request")
+        complete(record_id, data, content_type)
+    return True
@@ -0,0 +1,76 @@
+import re
+import threading
+from django.conf import settings
+
+# The single allow-list for comment HTML
+ALLOWED_TAGS = frozenset({"a", "code", "i", "strong", "br"})
+ALLOWED_ATTRIBUTES = {"a": frozenset({"href", "title"})}
+ALLOWED_PROTOCOLS = frozenset({"http", "https", "mailto"})
+
+# Every newline (\n, \r\n or \r) becomes one <br>
+NEWLINE_RE = re.compile(r"\r\n?|\n")
+
+
+def _bleach_backend():
+    import bleach
+    from bleach.sanitizer import Cleaner
+
+    # Cleaner instances are not thread-safe, so keep one per thread
+    local = threading.local()
+
+    def clean(text):
+        cleaner = getattr(local, "cleaner", None)
+        if cleaner is None:
+            cleaner = local.cleaner = Cleaner(
+                tags=ALLOWED_TAGS,
+                attributes={tag: list(attrs) for tag, attrs in ALLOWED_ATTRIBUTES.items()},
+                protocols=ALLOWED_PROTOCOLS,
+                strip=True,
+            )
+        return cleaner.clean(text)
+
+    return clean
+
+
+def _nh3_backend():
+    import nh3
+
+    # nh3 cleaners are immutable and safe to share between threads
+    cleaner = nh3.Cleaner(
+        tags=set(ALLOWED_TAGS),
+        attributes={tag: set(attrs) for tag, attrs in ALLOWED_ATTRIBUTES.items()},
+        url_schemes=set(ALLOWED_PROTOCOLS),
+        link_rel=None,
+    )
+    return cleaner.clean
+
+
+BACKENDS = {
+    "bleach": _bleach_backend,
+    "nh3": _nh3_backend,
+}
+
+_backends = {}
+_lock = threading.Lock()
+
+
+# Function to get the clean() callable of a backend ("auto" prefers nh3 when installed)
+def get_backend(name=None):
+    name = name or getattr(settings, "POSTS_SANITIZER_BACKEND", "auto")
+    if name == "auto":
+        try:
+            return get_backend("nh3")
+        except ImportError:
+            return get_backend("bleach")
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown sanitizer backend: {name}")
+    with _lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+# Function to turn a comment body into safe HTML: newlines to <br>, then the allow-list
+def sanitize(text, backend=None):
+    return get_backend(backend)(NEWLINE_RE.sub("<br>", text))
@@ -0,0 +1,138 @@
+import base64
+import binascii
+import html
+import json
+import re
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+# Full-text search over the comment text and username, outside the Post model:
+# - PostgreSQL: tsvector column posts_post.search_vector with a GIN index (migration
+#   0011_post_search), ranked with ts_rank_cd();
+# - SQLite: FTS5 table posts_post_fts (rowid = post id), ranked with bm25().
+# Both are filled by index_posts() when a post is created, and by the
+# rebuild_search_index command for existing posts.
+
+FTS_TABLE = "posts_post_fts"
+MAX_QUERY_LENGTH = 200
+# Posts per indexing statement (PostgreSQL takes at most 65535 parameters)
+INDEX_BATCH_SIZE = 1000
+
+TAG_RE = re.compile(r"<[^>]*>")
+WORD_RE = re.compile(r"\w+")
+
+
+def is_available():
+    return connection.vendor in ("postgresql", "sqlite")
+
+
+# Function to get the indexed text of a comment: tags become spaces (so "a<br>b" stays two words)
+def search_text(text_html):
+    return html.unescape(TAG_RE.sub(" ", text_html))
+
+
+# Function to add or replace posts in the search index; rows are (id, username, text_html)
+def index_posts(rows):
+    rows = [(post_id, username, search_text(text_html)) for post_id, username, text_html in rows]
+    if not is_available():
+        return
+    for start in range(0, len(rows), INDEX_BATCH_SIZE):
+        index_batch(rows[start:start + INDEX_BATCH_SIZE])
+
+
+def index_batch(rows):
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # One statement per batch; the username weighs more than the text
+            values = ", ".join(["(%s::bigint, %s, %s)"] * len(rows))
+            cursor.execute(
+                f"""
+                UPDATE posts_post AS p
+                SET search_vector = setweight(to_tsvector(%s::regconfig, v.username), 'A')
+                                 || setweight(to_tsvector(%s::regconfig, v.body), 'B')
+                FROM (VALUES {values}) AS v(id, username, body)
+                WHERE p.id = v.id
+                """,
+                [settings.POSTS_SEARCH_CONFIG, settings.POSTS_SEARCH_CONFIG, *(value for row in rows for value in row)],
+            )
+        else:
+            ids = [row[0] for row in rows]
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids)
+            cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, username, body) VALUES (%s, %s, %s)", rows)
+
+
+def index_post(post):
+    index_posts([(post.id, post.username, post.text_html)])
+
+
+# Function to validate the search query; returns it stripped
+def check_query(query):
+    query = query.strip()
+    if not WORD_RE.search(query):
+        raise ValidationError("q must contain at least one word.")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValidationError(f"q must be at most {MAX_QUERY_LENGTH} characters.")
+    return query
+
+
+# Function to encode the rank and id of the last result into an opaque cursor
+def encode_cursor(rank, post_id):
+    raw = json.dumps({"r": rank, "id": post_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return float(payload["r"]), int(payload["id"])
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise ValidationError("Invalid cursor.")
+
+
+# Function to build the query of matching (id, rank) rows, the best match having the highest rank
+def matches_query(query):
+    if connection.vendor == "postgresql":
+        # float8: the rank must survive the round trip through the cursor exactly
+        sql = """
+            SELECT id, ts_rank_cd(search_vector, query)::float8 AS rank
+            FROM posts_post, websearch_to_tsquery(%s::regconfig, %s) AS query
+            WHERE search_vector @@ query
+        """
+        return sql, [settings.POSTS_SEARCH_CONFIG, query]
+
+    # Every word must match; quoting keeps the FTS5 query syntax out of user input.
+    # The join skips index rows of deleted posts
+    terms = " ".join(f'"{word}"' for word in WORD_RE.findall(query))
+    sql = f"""
+        SELECT posts_post.id AS id, -bm25({FTS_TABLE}, 2.0, 1.0) AS rank
+        FROM {FTS_TABLE} JOIN posts_post ON posts_post.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+    """
+    return sql, [terms]
+
+
+# Function to return one page of search results by descending rank; returns
+# ([(post_id, rank)], next_cursor)
+def search_posts(query, limit, cursor=None):
+    sql, params = matches_query(query)
+    where = ""
+    if cursor:
+        rank, post_id = decode_cursor(cursor)
+        where = "WHERE rank < %s OR (rank = %s AND id < %s)"
+        params += [rank, rank, post_id]
+
+    with connection.cursor() as db_cursor:
+        # Fetch one extra row to know whether there is another page
+        db_cursor.execute(
+            f"SELECT id, rank FROM ({sql}) AS matches {where} ORDER BY rank DESC, id DESC LIMIT %s",
+            params + [limit + 1],
+        )
+        rows = db_cursor.fetchall()
+
+    results = rows[:limit]
+    next_cursor = encode_cursor(results[-1][1], results[-1][0]) if len(rows) > limit else None
+    return results, next_cursor
@@ -1,14 +1,32 @@
+import logging
+from collections import defaultdict
+from django.db import models
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Post, FileForPost
+from .metrics import count_node
+
+logger = logging.getLogger(__name__)
 
 class FileForPostSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
     class Meta:
         model = FileForPost
-        fields = ['filename', 'content_type', 'file_base64']
+        fields = ['id', 'filename', 'content_type', 'size', 'status', 'url']
+
+    def get_url(self, obj):
+        if not obj.is_ready:
+            return None
+        url = reverse("post-file", args=[obj.id])
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
 
 class PostSerializer(serializers.ModelSerializer):
     replies = serializers.SerializerMethodField()
-    files = FileForPostSerializer(many=True, read_only=True)
+    files = serializers.SerializerMethodField()
+    omitted_replies = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
@@ -16,9 +34,101 @@ class PostSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        print(f"Serializing post {instance.id}: text_html = {repr(data.get('text_html'))}")
+        count_node()
+        logger.debug("Serializing post %s: text_html = %r", instance.id, data.get('text_html'))
         return data
 
+    def get_files(self, obj):
+        # Use the files attached by load_threads() when available
+        files = getattr(obj, "tree_files", None)
+        if files is None:
+            files = obj.files.all()
+        return FileForPostSerializer(files, many=True, context=self.context).data
+
     def get_replies(self, obj):
-        children = Post.objects.filter(parent=obj).order_by("created_at")
-        return PostSerializer(children, many=True).data
+        # Use the replies attached by load_threads() when available
+        children = getattr(obj, "tree_replies", None)
+        if children is None:
+            children = Post.objects.filter(parent=obj).order_by("created_at")
+        return PostSerializer(children, many=True, context=self.context).data
+
+    def get_omitted_replies(self, obj):
+        # Replies left out of tree_replies by the list limits (see tree.bounded_descendants_query())
+        children = getattr(obj, "tree_replies", None)
+        if children is None:
+            return 0
+        return max(obj.reply_count - len(children), 0)
+
+
+# Lean serializer of the posts list: the output of PostSerializer (which stays the
+# reference, see the parity test) built from .values() rows with plain dicts, without
+# DRF field machinery. Output keys in PostSerializer order: pk, declared fields, model
+# fields, then relations
+POST_OUTPUT = [
+    (field.name, field.attname, isinstance(field, models.DateTimeField))
+    for field in sorted(
+        (field for field in Post._meta.concrete_fields if not field.primary_key),
+        key=lambda field: field.is_relation,
+    )
+]
+
+
+# Function to format a datetime as DRF does (ISO 8601 in the current time zone, "Z" for UTC).
+# The time zone is looked up once by the caller: timezone.localtime() per value is slow
+def format_datetime(value, tz):
+    if value.utcoffset() is not None:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+# Function to get the file URL without its id (reversed once per list instead of once per file)
+def file_url_prefix(request=None):
+    url = reverse("post-file", args=[0])
+    if request is not None:
+        url = request.build_absolute_uri(url)
+    return url[:-len("0/")]
+
+
+def serialize_file(row, url_prefix):
+    ready = row["status"] == FileForPost.STATUS_READY
+    return {
+        "id": row["id"],
+        "filename": row["filename"],
+        "content_type": row["content_type"],
+        "size": row["size"],
+        "status": row["status"],
+        "url": f"{url_prefix}{row['id']}/" if ready else None,
+    }
+
+
+# Function to serialize the rows of tree.load_thread_rows() into nested posts
+def serialize_threads(roots, descendants, files, request=None):
+    children = defaultdict(list)
+    for row in descendants:
+        children[row["parent_id"]].append(row)
+
+    url_prefix = file_url_prefix(request)
+    files_by_post = defaultdict(list)
+    for row in files:
+        files_by_post[row["post_id"]].append(serialize_file(row, url_prefix))
+
+    count_node(len(roots) + len(descendants))
+    tz = timezone.get_current_timezone()
+
+    def serialize(row):
+        replies = children.get(row["id"], ())
+        data = {
+            "id": row["id"],
+            "replies": [serialize(child) for child in replies],
+            "files": files_by_post.get(row["id"], []),
+            "omitted_replies": max(row["reply_count"] - len(replies), 0),
+        }
+        for name, column, is_datetime in POST_OUTPUT:
+            value = row[column]
+            data[name] = format_datetime(value, tz) if is_datetime and value is not None else value
+        return data
+
+    return [serialize(row) for row in roots]
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import FileForPost, Blob
+
+
+# Release the blobs of deleted attachments (also runs for cascades from Post)
+@receiver(post_delete, sender=FileForPost)
+def release_file_blobs(sender, instance, **kwargs):
+    for digest in instance.held_digests():
+        Blob.release(digest)
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+# Interface of a content-addressed store for attachment bytes
+class BlobStore:
+    def save(self, data):
+        """Store ``data`` and return its SHA-256 hex digest."""
+        raise NotImplementedError
+
+    def open(self, digest):
+        """Return a binary file object for the blob."""
+        raise NotImplementedError
+
+    def exists(self, digest):
+        raise NotImplementedError
+
+    def delete(self, digest):
+        raise NotImplementedError
+
+    def writer(self):
+        """Return a BlobWriter that stores a blob written in chunks."""
+        return BlobWriter(self)
+
+
+# Writer for stores that can only save whole blobs: chunks are spooled to a temporary file
+class BlobWriter:
+    def __init__(self, store):
+        self.store = store
+        self.hash = hashlib.sha256()
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+
+    def write(self, chunk):
+        self.hash.update(chunk)
+        self.buffer.write(chunk)
+
+    def digest(self):
+        """SHA-256 hex digest of the bytes written so far."""
+        return self.hash.hexdigest()
+
+    def commit(self):
+        """Store the written bytes and return their SHA-256 hex digest."""
+        try:
+            self.buffer.seek(0)
+            return self.store.save(self.buffer.read())
+        finally:
+            self.buffer.close()
+
+    def abort(self):
+        self.buffer.close()
+
+
+# Local filesystem store, sharded by the first bytes of the SHA-256 digest
+class LocalBlobStore(BlobStore):
+    def __init__(self, root=None):
+        self.root = str(root or settings.POSTS_BLOB_ROOT)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def save(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest
+
+        # Write to a temporary file first so readers never see a partial blob
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def open(self, digest):
+        return open(self.path(digest), "rb")
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def writer(self):
+        return LocalBlobWriter(self)
+
+
+# Streams chunks to a temporary file in the store, hashing them on the way
+class LocalBlobWriter(BlobWriter):
+    def __init__(self, store):
+        self.store = store
+        self.hash = hashlib.sha256()
+        os.makedirs(store.root, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=store.root, prefix=".tmp-")
+        self.tmp = os.fdopen(fd, "wb")
+
+    def write(self, chunk):
+        self.hash.update(chunk)
+        self.tmp.write(chunk)
+
+    def commit(self):
+        self.tmp.close()
+        digest = self.digest()
+        path = self.store.path(digest)
+        try:
+            if os.path.exists(path):
+                os.remove(self.tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(self.tmp_path, path)
+        except BaseException:
+            self.abort()
+            raise
+        return digest
+
+    def abort(self):
+        self.tmp.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+# Function to get the configured blob store (POSTS_BLOB_STORE setting)
+@lru_cache(maxsize=None)
+def get_blob_store():
+    return import_string(settings.POSTS_BLOB_STORE)()
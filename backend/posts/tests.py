@@ -1,3 +1,612 @@
-from django.test import TestCase
+import datetime
+import importlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from captcha.models import CaptchaStore
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, Client, override_settings
+from django.urls import clear_url_caches
+from django.utils import timezone
+from backend import urls as backend_urls
+from . import processing, urls as posts_urls
+from .models import Post, FileForPost, Blob, path_segment
+from .pagination import SORT_FIELDS, SORT_ORDERS, get_ordering
+from .processing import complete, prepare_attachments
+from .storage import get_blob_store
+from .uploads import release_uploads
+from .sanitizer import BACKENDS, sanitize
+from .serializers import PostSerializer, serialize_threads
+from .threads import COUNTER_FIELDS
+from .tree import load_threads, load_thread_rows
+from .utils import dump_json
 
-# Create your tests here.
+
+class SanitizerTests(SimpleTestCase):
+    def backends(self):
+        for name in BACKENDS:
+            try:
+                sanitize("", backend=name)
+            except ImportError:
+                continue
+            yield name
+
+    def test_newlines_become_br(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(sanitize("a\nb\r\nc\n\n\nd", backend), "a<br>b<br>c<br><br><br>d")
+
+    def test_allowed_tags_are_kept(self):
+        text = '<a href="https://example.com" title="t">x</a> <code>y</code> <i>z</i> <strong>w</strong>'
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(sanitize(text, backend), text)
+
+    def test_disallowed_markup_is_stripped(self):
+        text = '<b class="x">bold</b><img src=x onerror="alert(1)"><i style="color:red">it</i>'
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(sanitize(text, backend), "bold<i>it</i>")
+
+    def test_unsafe_links_lose_attributes(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(
+                    sanitize('<a href="javascript:alert(1)" onclick="x()">bad</a>', backend),
+                    "<a>bad</a>",
+                )
+
+    def test_text_is_escaped(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(sanitize("1 < 2 & 3 > 2", backend), "1 &lt; 2 &amp; 3 &gt; 2")
+
+
+# Function to create a post the way the create view places it in its thread
+def create_post(parent=None, **fields):
+    post = Post.objects.create(
+        username=fields.pop("username", "user"), email=fields.pop("email", "user@example.com"),
+        text_html="Text & <code>x</code>", parent=parent, **fields,
+    )
+    post.set_thread_position()
+    post.update_ancestor_counters()
+    return post
+
+
+# The list endpoint serializes with serialize_threads(); PostSerializer is the reference
+class ListSerializerParityTests(TestCase):
+    def setUp(self):
+        first = create_post(homepage_url="https://example.com")
+        second = create_post(username="other")
+        reply = create_post(first)
+        create_post(reply, username="ünïcode")
+        create_post(first)
+        create_post(second)
+        for post, status in [(first, FileForPost.STATUS_READY), (reply, FileForPost.STATUS_PENDING)]:
+            FileForPost.objects.create(
+                post=post, sha256="0" * 64, size=10, filename="a.txt", content_type="text/plain", status=status,
+            )
+
+    def test_same_output_as_post_serializer(self):
+        request = RequestFactory().get("/api/posts/get/")
+        roots = list(Post.objects.filter(parent=None).order_by("id"))
+
+        expected = PostSerializer(load_threads(roots), many=True, context={"request": request}).data
+        actual = serialize_threads(*load_thread_rows(roots), request)
+
+        self.assertEqual(json.loads(dump_json(actual)), json.loads(json.dumps(expected)))
+        self.assertEqual(list(actual[0]), list(expected[0]))
+        self.assertEqual(list(actual[0]["files"][0]), list(expected[0]["files"][0]))
+
+
+# Function to get the captcha fields of a valid answer
+def captcha_fields():
+    key = CaptchaStore.generate_key()
+    return {"captcha_0": key, "captcha_1": CaptchaStore.objects.get(hashkey=key).response}
+
+
+# Tests that run data migrations on rows created with the historical models
+class MigrationTestCase(TransactionTestCase):
+    def setUp(self):
+        self.addCleanup(self.migrate, None)
+
+    # Function to migrate the posts app to a migration (None: the latest); returns its models
+    def migrate(self, name):
+        executor = MigrationExecutor(connection)
+        targets = executor.loader.graph.leaf_nodes("posts") if name is None else [("posts", name)]
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+
+class ReplyCounterTests(TestCase):
+    def test_counters_follow_new_replies(self):
+        root = create_post()
+        reply = create_post(root)
+        create_post(reply)
+        create_post(root)
+
+        root.refresh_from_db()
+        self.assertEqual((root.reply_count, root.descendant_count), (2, 3))
+        self.assertEqual(root.last_activity_at, Post.objects.latest("id").created_at)
+
+    # Two replies committing out of order must not move the activity backwards
+    def test_activity_never_goes_backwards(self):
+        root = create_post()
+        older, newer = create_post(root), create_post(root)
+        Post.objects.filter(id=older.id).update(created_at=newer.created_at - datetime.timedelta(minutes=1))
+        older.refresh_from_db()
+
+        older.update_ancestor_counters()
+        root.refresh_from_db()
+        self.assertEqual(root.last_activity_at, newer.created_at)
+
+    def test_recount_fixes_drift(self):
+        root = create_post()
+        create_post(create_post(root))
+        expected = list(Post.objects.order_by("id").values_list(*COUNTER_FIELDS))
+        Post.objects.update(reply_count=7, descendant_count=7, last_activity_at=timezone.now())
+
+        call_command("recount_replies", stdout=io.StringIO())
+        self.assertEqual(list(Post.objects.order_by("id").values_list(*COUNTER_FIELDS)), expected)
+
+
+class ThreadPathMigrationTests(MigrationTestCase):
+    def test_paths_of_existing_posts(self):
+        Post = self.migrate("0003_fileforpost").get_model("posts", "Post")
+        posts = {}
+        for name, parent in [("root", None), ("reply", "root"), ("nested", "reply"), ("other", None)]:
+            posts[name] = Post.objects.create(
+                username="user", email="user@example.com", text_html="Text", parent=posts.get(parent)
+            )
+
+        Post = self.migrate("0004_post_thread_path").get_model("posts", "Post")
+        paths = {
+            name: Post.objects.values_list("thread_root_id", "path", "depth").get(id=post.id)
+            for name, post in posts.items()
+        }
+        root, reply, nested, other = (posts[name].id for name in ["root", "reply", "nested", "other"])
+        self.assertEqual(paths["root"], (root, path_segment(root), 0))
+        self.assertEqual(paths["reply"], (root, path_segment(root) + path_segment(reply), 1))
+        self.assertEqual(paths["nested"], (root, path_segment(root) + path_segment(reply) + path_segment(nested), 2))
+        self.assertEqual(paths["other"], (other, path_segment(other), 0))
+
+
+class ReplyCounterMigrationTests(MigrationTestCase):
+    def test_counters_of_existing_posts(self):
+        Post = self.migrate("0007_changesequence").get_model("posts", "Post")
+        now = timezone.now()
+        posts = {}
+        for name, parent, minutes in [("root", None, 0), ("reply", "root", 1), ("nested", "reply", 2), ("other", "root", 3)]:
+            parent = posts.get(parent)
+            post = Post.objects.create(username="user", email="user@example.com", text_html="Text", parent=parent)
+            # Thread paths as the create view sets them
+            Post.objects.filter(id=post.id).update(
+                created_at=now + datetime.timedelta(minutes=minutes),
+                thread_root_id=parent.thread_root_id if parent else post.id,
+                path=(parent.path if parent else "") + path_segment(post.id),
+            )
+            post.refresh_from_db()
+            posts[name] = post
+
+        Post = self.migrate("0008_post_reply_counters").get_model("posts", "Post")
+        counters = {
+            name: Post.objects.values_list("reply_count", "descendant_count", "last_activity_at").get(id=post.id)
+            for name, post in posts.items()
+        }
+        self.assertEqual(counters["root"], (2, 3, now + datetime.timedelta(minutes=3)))
+        self.assertEqual(counters["reply"], (1, 1, now + datetime.timedelta(minutes=2)))
+        self.assertEqual(counters["other"], (0, 0, now + datetime.timedelta(minutes=3)))
+
+
+# Keyset pages must cover every top-level post exactly once, in both directions, including
+# ties on the sort field (broken by id)
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        now = timezone.now()
+        for index, username in enumerate(["bob", "amy", "bob", "cat", "amy", "bob", "amy"]):
+            post = create_post(username=username, email=f"{username}@example.com")
+            # Equal timestamps in pairs
+            moment = now - datetime.timedelta(minutes=index // 2)
+            Post.objects.filter(id=post.id).update(created_at=moment, last_activity_at=moment)
+            for _ in range(index % 3):
+                create_post(post)
+
+    def walk(self, sort_by, sort_order, cursor_key, cursor=None):
+        ids = []
+        while True:
+            params = {"pagination": "cursor", "limit": 3, "sort_by": sort_by, "sort_order": sort_order, "max_depth": 0}
+            if cursor:
+                params["cursor"] = cursor
+            data = json.loads(self.client.get("/api/posts/get/", params).content)
+            page = [post["id"] for post in data["posts"]]
+            ids = ids + page if cursor_key == "next" else page + ids
+            if not data[cursor_key]:
+                return ids, data
+            cursor = data[cursor_key]
+
+    def test_forward_and_backward_walks(self):
+        for sort_by in SORT_FIELDS:
+            for sort_order in SORT_ORDERS:
+                with self.subTest(sort_by=sort_by, sort_order=sort_order):
+                    expected = list(
+                        Post.objects.filter(parent=None)
+                        .order_by(*get_ordering(sort_by, sort_order == "desc"))
+                        .values_list("id", flat=True)
+                    )
+                    forward, last_page = self.walk(sort_by, sort_order, "next")
+                    self.assertEqual(forward, expected)
+
+                    # Back from the last page to the first
+                    backward, first_page = self.walk(sort_by, sort_order, "prev", last_page["prev"])
+                    self.assertEqual(backward + [post["id"] for post in last_page["posts"]], expected)
+                    self.assertIsNone(first_page["prev"])
+
+
+# Replies beyond the tree limits are counted in omitted_replies and paged from /replies/
+class ReplyTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.root = create_post()
+        self.children = [create_post(self.root) for _ in range(5)]
+        self.grandchildren = [create_post(self.children[0]) for _ in range(3)]
+        create_post(self.grandchildren[0])
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def shape(self, nodes):
+        return [(node["id"], node["omitted_replies"], self.shape(node["replies"])) for node in nodes]
+
+    def test_list_limits(self):
+        children, grandchildren = [post.id for post in self.children], [post.id for post in self.grandchildren]
+        posts = self.get("/api/posts/get/", max_depth=2, max_replies_per_node=2)["posts"]
+        self.assertEqual(self.shape(posts), [
+            (self.root.id, 3, [
+                (children[0], 1, [(grandchildren[0], 1, []), (grandchildren[1], 0, [])]),
+                (children[1], 0, []),
+            ]),
+        ])
+
+        posts = self.get("/api/posts/get/", max_depth=0)["posts"]
+        self.assertEqual(self.shape(posts), [(self.root.id, 5, [])])
+
+    def test_replies_pages(self):
+        url = f"/api/posts/{self.root.id}/replies/"
+        pages, cursor = [], None
+        while True:
+            data = self.get(url, limit=2, max_depth=1, max_replies_per_node=1, **({"cursor": cursor} if cursor else {}))
+            self.assertEqual(data["reply_count"], 5)
+            pages.append(data)
+            cursor = data["next"]
+            if not cursor:
+                break
+
+        self.assertEqual([node["id"] for page in pages for node in page["replies"]], [post.id for post in self.children])
+        self.assertIsNone(pages[0]["prev"])
+        # max_depth counts from the replies
+        self.assertEqual(self.shape(pages[0]["replies"])[0], (self.children[0].id, 2, [(self.grandchildren[0].id, 1, [])]))
+
+        previous = self.get(url, limit=2, cursor=pages[-1]["prev"])
+        self.assertEqual(previous["replies"], self.get(url, limit=2, cursor=pages[0]["next"])["replies"])
+
+        self.assertEqual(self.client.get("/api/posts/999/replies/").status_code, 404)
+        self.assertEqual(self.client.get(url, {"cursor": "zz"}).status_code, 400)
+
+
+# Tests that write attachments get their own blob store directory
+class BlobStoreTestCase(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        overrides = override_settings(POSTS_BLOB_ROOT=root, POSTS_IMAGE_PROCESSING="sync")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        get_blob_store.cache_clear()
+        self.addCleanup(get_blob_store.cache_clear)
+
+    def create(self, client=None, files=(), headers=None, **fields):
+        data = {
+            "username": "user", "email": "user@example.com", "text_html": "Text",
+            **captcha_fields(), **fields,
+        }
+        if files:
+            data["files"] = list(files)
+        return (client or self.client).post("/api/posts/create/", data, **(headers or {}))
+
+
+class UploadHandlerTests(BlobStoreTestCase):
+    def assertRejected(self, response, message):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": [message]})
+        self.assertFalse(Post.objects.exists())
+
+    def test_unsupported_type(self):
+        response = self.create(files=[SimpleUploadedFile("a.pdf", b"%PDF-1.4", "application/pdf")])
+        self.assertRejected(response, "Unsupported file type.")
+
+    def test_text_file_needs_txt_extension(self):
+        response = self.create(files=[SimpleUploadedFile("a.md", b"text", "text/plain")])
+        self.assertRejected(response, "Invalid file format. Only TXT files are allowed.")
+
+    def test_image_signature_is_checked(self):
+        response = self.create(files=[SimpleUploadedFile("a.png", b"not a png at all", "image/png")])
+        self.assertRejected(response, "Invalid image file.")
+
+    @override_settings(POSTS_UPLOAD_MAX_TEXT_SIZE=1024)
+    def test_text_size_limit(self):
+        response = self.create(files=[SimpleUploadedFile("a.txt", b"x" * 2048, "text/plain")])
+        self.assertRejected(response, "a.txt exceeds the 1KB size limit.")
+
+    def test_text_file_is_stored(self):
+        response = self.create(files=[SimpleUploadedFile("a.txt", b"hello", "text/plain")])
+        self.assertEqual(response.status_code, 201)
+        record = FileForPost.objects.get()
+        self.assertTrue(get_blob_store().exists(record.sha256))
+
+    def test_release_without_parsed_files(self):
+        release_uploads(RequestFactory().get("/"))
+
+    # Files that did not go through the handler get the same limits
+    @override_settings(POSTS_UPLOAD_MAX_TEXT_SIZE=1024, POSTS_UPLOAD_MAX_IMAGE_SIZE=1024 * 1024)
+    def test_limits_without_the_handler(self):
+        files = [
+            (SimpleUploadedFile("a.txt", b"a" * 1025, "text/plain"), "a.txt exceeds the 1KB size limit."),
+            (SimpleUploadedFile("a.png", b"a" * (1024 * 1024 + 1), "image/png"), "a.png exceeds the 1MB size limit."),
+        ]
+        for file, message in files:
+            with self.subTest(file=file.name), self.assertRaisesMessage(ValidationError, message):
+                prepare_attachments([file])
+        self.assertFalse(Blob.objects.exists())
+
+    # SessionAuthentication parses the body for its CSRF check before the view runs
+    def test_session_authenticated_request(self):
+        user = get_user_model().objects.create_user("admin", password="secret", is_staff=True)
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(user)
+        client.get("/api/csrf/get/")
+        headers = {"HTTP_X_CSRFTOKEN": client.cookies["csrftoken"].value}
+
+        response = self.create(client, files=[SimpleUploadedFile("a.pdf", b"%PDF", "application/pdf")], headers=headers)
+        self.assertRejected(response, "Unsupported file type.")
+
+        response = self.create(client, files=[SimpleUploadedFile("a.txt", b"hello", "text/plain")], headers=headers)
+        self.assertEqual(response.status_code, 201)
+
+
+# POSTS_ASYNC_VIEWS is read when the URLs are loaded
+def use_async_views(test):
+    overrides = override_settings(POSTS_ASYNC_VIEWS=True)
+    overrides.enable()
+    test.addCleanup(reload_urls)
+    test.addCleanup(overrides.disable)
+    reload_urls()
+
+
+def reload_urls():
+    importlib.reload(posts_urls)
+    importlib.reload(backend_urls)
+    clear_url_caches()
+
+
+# The sync and async list views must agree on which pages exist
+class PageNumberTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.ids = [create_post().id for _ in range(5)][::-1]
+
+    def check_pages(self):
+        for page, status, ids in [("1", 200, self.ids[:2]), ("3", 200, self.ids[4:]), ("0", 400, None), ("4", 400, None), ("x", 400, None)]:
+            with self.subTest(page=page):
+                response = self.client.get("/api/posts/get/", {"page": page, "limit": 2})
+                self.assertEqual(response.status_code, status)
+                if ids is not None:
+                    self.assertEqual([post["id"] for post in response.json()["posts"]], ids)
+                    self.assertEqual(response.json()["totalPages"], 3)
+
+    def test_sync_view(self):
+        self.check_pages()
+
+    def test_async_view(self):
+        use_async_views(self)
+        self.check_pages()
+
+    def test_empty_list_has_a_first_page(self):
+        Post.objects.all().delete()
+        for setup in (lambda: None, lambda: use_async_views(self)):
+            setup()
+            response = self.client.get("/api/posts/get/", {"page": 1})
+            self.assertEqual((response.status_code, response.json()["totalPages"]), (200, 1))
+
+
+class AsyncPostCreateViewTests(BlobStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        use_async_views(self)
+
+    def test_rejected_upload_keeps_the_captcha(self):
+        fields = captcha_fields()
+        response = self.create(files=[SimpleUploadedFile("a.pdf", b"%PDF-1.4", "application/pdf")], **fields)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(CaptchaStore.objects.filter(hashkey=fields["captcha_0"]).exists())
+
+        self.assertEqual(self.create(**fields).status_code, 201)
+
+    def test_session_requests_need_a_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(get_user_model().objects.create_user("admin", password="secret"))
+        self.assertEqual(self.create(client).status_code, 403)
+
+        client.get("/api/csrf/get/")
+        headers = {"HTTP_X_CSRFTOKEN": client.cookies["csrftoken"].value}
+        self.assertEqual(self.create(client, headers=headers).status_code, 201)
+
+
+class FileForPostViewTests(BlobStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create(files=[SimpleUploadedFile("a.txt", b"hello world", "text/plain")])
+        self.url = f"/api/posts/files/{FileForPost.objects.get().id}/"
+
+    def test_browser_accept_header(self):
+        response = self.client.get(self.url, HTTP_ACCEPT="image/avif,image/webp,image/*,*/*;q=0.8")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"hello world")
+        vary = response.get("Vary", "").lower()
+        self.assertNotIn("accept", vary.split(", "))
+        self.assertNotIn("cookie", vary)
+
+    def test_range_and_etag(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=6-")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"world")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+
+def png_file(name, color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), "image/png")
+
+
+class AttachmentTests(BlobStoreTestCase):
+    def ref_counts(self):
+        return dict(Blob.objects.values_list("sha256", "ref_count"))
+
+    # One reference per attachment on shared bytes; the bytes go with the last one
+    def test_ref_counts_across_create_dedup_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.create(files=[png_file("a.png"), SimpleUploadedFile("a.txt", b"same", "text/plain")])
+        digests = set(FileForPost.objects.values_list("sha256", flat=True))
+        self.assertEqual(self.ref_counts(), dict.fromkeys(digests, 1))
+
+        # Same bytes under other names: no new blobs
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.create(files=[png_file("b.png"), SimpleUploadedFile("b.txt", b"same", "text/plain")])
+        self.assertEqual(set(FileForPost.objects.values_list("sha256", flat=True)), digests)
+        self.assertEqual(self.ref_counts(), dict.fromkeys(digests, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.filter(id=json.loads(first.content)["post_id"]).delete()
+        self.assertEqual(self.ref_counts(), dict.fromkeys(digests, 1))
+        self.assertTrue(all(get_blob_store().exists(digest) for digest in digests))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.filter(id=json.loads(second.content)["post_id"]).delete()
+        self.assertEqual(self.ref_counts(), {})
+        self.assertFalse(any(get_blob_store().exists(digest) for digest in digests))
+
+    # The bytes of a rendition can go with its last reference between the lookup and the acquire
+    def test_rendition_without_bytes_is_rendered_again(self):
+        self.create(files=[png_file("a.png")])
+        rendition = FileForPost.objects.get()
+        Blob.objects.filter(sha256=rendition.sha256).delete()
+        get_blob_store().delete(rendition.sha256)
+
+        response = self.create(files=[png_file("b.png")])
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(get_blob_store().exists(rendition.sha256))
+        self.assertEqual(self.ref_counts(), {rendition.sha256: 1})
+
+    # A full pool leaves the attachment pending instead of rendering in the create request
+    def test_saturated_pool_leaves_attachments_pending(self):
+        with override_settings(POSTS_IMAGE_PROCESSING="background"):
+            self.create(files=[png_file("a.png")])
+        record = FileForPost.objects.get()
+
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with (
+            mock.patch.object(processing, "get_executor"),
+            mock.patch.object(processing, "_slots", slots),
+            mock.patch.object(processing, "render_image") as render_image,
+        ):
+            processing.submit(record.id)
+        render_image.assert_not_called()
+        self.assertEqual(FileForPost.objects.get().status, FileForPost.STATUS_PENDING)
+
+    def test_attachment_deleted_during_processing(self):
+        with override_settings(POSTS_IMAGE_PROCESSING="background"):
+            self.create(files=[png_file("a.png")])
+        record = FileForPost.objects.get()
+        record.delete()
+
+        complete(record.id, b"processed", "image/jpeg")
+        self.assertEqual(self.ref_counts(), {})
+
+
+class PostDetailViewTests(BlobStoreTestCase):
+    def test_post_with_files_without_replies(self):
+        post_id = json.loads(self.create(files=[SimpleUploadedFile("a.txt", b"hello", "text/plain")]).content)["post_id"]
+        self.create(parent_id=post_id)
+
+        response = self.client.get(f"/api/posts/{post_id}/")
+        self.assertEqual(response.status_code, 200)
+        post = json.loads(response.content)["post"]
+        self.assertEqual((post["id"], post["username"], post["replies"], post["omitted_replies"]), (post_id, "user", [], 1))
+        self.assertEqual([file["filename"] for file in post["files"]], ["a.txt"])
+
+        self.assertEqual(self.client.get("/api/posts/999/").status_code, 404)
+
+
+# SQLite test database: the FTS5 index of migration 0011
+class PostSearchViewTests(BlobStoreTestCase):
+    def search(self, **params):
+        return self.client.get("/api/posts/search/", params)
+
+    def result_ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [post["id"] for post in json.loads(response.content)["results"]]
+
+    def test_new_posts_are_indexed(self):
+        post_id = json.loads(self.create(text_html="Searching for <strong>zebras</strong>").content)["post_id"]
+        self.assertEqual(self.result_ids(self.search(q="zebras")), [post_id])
+        self.assertEqual(self.result_ids(self.search(q="strong")), [])
+
+    def test_invalid_query(self):
+        for query in ["", "   ", "!!! ???", "x" * 201]:
+            response = self.search(q=query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn("error", json.loads(response.content))
+        self.assertEqual(self.search(q="zebra", cursor="not a cursor").status_code, 400)
+
+    # The username weighs more than the text
+    def test_ranking_order(self):
+        in_username = json.loads(self.create(username="zebra", text_html="hello").content)["post_id"]
+        in_text = json.loads(self.create(username="user", text_html="zebra").content)["post_id"]
+        self.assertEqual(self.result_ids(self.search(q="zebra")), [in_username, in_text])
+
+    # Equal ranks are paged by descending id, each post exactly once
+    def test_cursor_pages(self):
+        post_ids = [json.loads(self.create(text_html="zebra").content)["post_id"] for _ in range(3)]
+        self.create(text_html="horse")
+
+        ids = []
+        cursor = None
+        while True:
+            params = {"q": "zebra", "limit": 1}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.search(**params)
+            ids += self.result_ids(response)
+            cursor = json.loads(response.content)["next"]
+            if cursor is None:
+                break
+        self.assertEqual(ids, sorted(post_ids, reverse=True))
@@ -0,0 +1,95 @@
+from django.db import transaction
+from .models import path_segment
+
+# Thread maintenance shared by the management commands and the data migrations. The functions
+# take the Post model as an argument, so migrations can pass their historical model.
+
+COUNTER_FIELDS = ["reply_count", "descendant_count", "last_activity_at"]
+
+
+# Function to fill thread_root, path and depth of every post, walking the trees level by level
+# from the top-level posts; returns the number of posts updated
+def backfill_thread_paths(Post, batch_size=1000):
+    # Top-level posts start their own thread
+    frontier = {}
+    batch = []
+    for post in Post.objects.filter(parent=None).only("id").iterator(chunk_size=batch_size):
+        post.thread_root_id = post.id
+        post.path = path_segment(post.id)
+        post.depth = 0
+        frontier[post.id] = post
+        batch.append(post)
+        if len(batch) >= batch_size:
+            save_thread_paths(Post, batch)
+            batch = []
+    save_thread_paths(Post, batch)
+    updated = len(frontier)
+
+    # Derive each post from its parent
+    while frontier:
+        next_frontier = {}
+        parent_ids = list(frontier)
+        for start in range(0, len(parent_ids), batch_size):
+            chunk = parent_ids[start:start + batch_size]
+            batch = list(Post.objects.filter(parent_id__in=chunk).only("id", "parent_id"))
+            for post in batch:
+                parent = frontier[post.parent_id]
+                post.thread_root_id = parent.thread_root_id
+                post.path = parent.path + path_segment(post.id)
+                post.depth = parent.depth + 1
+                next_frontier[post.id] = post
+            save_thread_paths(Post, batch)
+        updated += len(next_frontier)
+        frontier = next_frontier
+    return updated
+
+
+def save_thread_paths(Post, batch):
+    if not batch:
+        return
+    with transaction.atomic():
+        Post.objects.bulk_update(batch, ["thread_root", "path", "depth"])
+
+
+# Function to recompute reply_count, descendant_count and last_activity_at of every post,
+# thread by thread (requires thread paths); returns the number of posts fixed
+def recount_replies(Post, batch_size=500):
+    roots = Post.objects.filter(parent=None).order_by("id").values_list("id", flat=True)
+
+    fixed = 0
+    last_id = 0
+    while True:
+        root_ids = list(roots.filter(id__gt=last_id)[:batch_size])
+        if not root_ids:
+            return fixed
+        last_id = root_ids[-1]
+        fixed += recount_threads(Post, root_ids)
+
+
+def recount_threads(Post, root_ids):
+    # Reverse path order visits every child before its parent
+    posts = list(
+        Post.objects.filter(thread_root_id__in=root_ids)
+        .order_by("-thread_root", "-path")
+        .only("id", "parent_id", "created_at", *COUNTER_FIELDS)
+    )
+
+    counts = {post.id: [0, 0, post.created_at] for post in posts}
+    for post in posts:
+        replies, descendants, last_activity = counts[post.id]
+        parent = counts.get(post.parent_id)
+        if parent is not None:
+            parent[0] += 1
+            parent[1] += descendants + 1
+            parent[2] = max(parent[2], last_activity)
+
+    changed = []
+    for post in posts:
+        values = counts[post.id]
+        if [post.reply_count, post.descendant_count, post.last_activity_at] != values:
+            post.reply_count, post.descendant_count, post.last_activity_at = values
+            changed.append(post)
+
+    with transaction.atomic():
+        Post.objects.bulk_update(changed, COUNTER_FIELDS, batch_size=500)
+    return len(changed)
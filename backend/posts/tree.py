@@ -0,0 +1,148 @@
+from collections import defaultdict
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from .models import Post, FileForPost
+
+# Columns read by the lean list serializer (serializers.serialize_threads)
+POST_COLUMNS = tuple(field.attname for field in Post._meta.concrete_fields)
+FILE_COLUMNS = ("id", "post_id", "filename", "content_type", "size", "status")
+
+
+# Every descendant of the given roots, in display order (one range scan over (thread_root, path))
+def descendants_query(root_ids):
+    return Post.objects.filter(thread_root_id__in=root_ids, depth__gt=0).order_by("thread_root", "path")
+
+
+# Function to build the query of the descendants of the given posts within the tree limits,
+# in display order: a recursive walk that keeps the first max_replies replies (by id, which
+# is display order) of every post reached, down to max_depth levels. Each step reads at most
+# max_replies rows of the (parent, id) index, so the cost follows the size of the result,
+# not the size of the thread (None: no limit)
+def bounded_descendants_query(top_ids, max_depth=None, max_replies=None):
+    if max_depth == 0 or max_replies == 0:
+        return Post.objects.none()
+
+    table = connection.ops.quote_name(Post._meta.db_table)
+    limit, limit_params = ("LIMIT %s", [max_replies]) if max_replies is not None else ("", [])
+    if connection.vendor == "postgresql":
+        step = f"""
+            SELECT reply.id, tree.level + 1 FROM tree
+            CROSS JOIN LATERAL (
+                SELECT id FROM {table} WHERE parent_id = tree.id ORDER BY id {limit}
+            ) AS reply
+        """
+    else:
+        step = f"""
+            SELECT reply.id, tree.level + 1 FROM tree
+            JOIN {table} AS reply ON reply.id IN (
+                SELECT id FROM {table} WHERE parent_id = tree.id ORDER BY id {limit}
+            )
+        """
+    depth, depth_params = ("WHERE tree.level < %s", [max_depth]) if max_depth is not None else ("", [])
+    placeholders = ", ".join(["%s"] * len(top_ids))
+    sql = f"""
+        WITH RECURSIVE tree(id, level) AS (
+            SELECT id, 0 FROM {table} WHERE id IN ({placeholders})
+            UNION ALL
+            {step} {depth}
+        )
+        SELECT id FROM tree WHERE level > 0
+    """
+    params = [*top_ids, *limit_params, *depth_params]
+    return Post.objects.filter(id__in=RawSQL(sql, params)).order_by("thread_root", "path")
+
+
+def files_query(post_ids):
+    return FileForPost.objects.filter(post_id__in=post_ids).order_by("id")
+
+
+# Function to attach children to tree_replies and files to tree_files of every node
+def build_tree(roots, descendants, files):
+    children = defaultdict(list)
+    for post in descendants:
+        children[post.parent_id].append(post)
+
+    files_by_post = defaultdict(list)
+    for record in files:
+        files_by_post[record.post_id].append(record)
+
+    for post in roots + descendants:
+        post.tree_replies = children.get(post.id, [])
+        post.tree_files = files_by_post.get(post.id, [])
+
+    return roots
+
+
+# Function to load whole comment threads for a page of top-level posts
+def load_threads(roots):
+    roots = list(roots)
+    if not roots:
+        return roots
+
+    descendants = list(descendants_query([root.id for root in roots]))
+
+    # One query for the files of the whole page
+    files = list(files_query([post.id for post in roots + descendants]))
+
+    # Build the nested structure in Python
+    return build_tree(roots, descendants, files)
+
+
+def post_row(post):
+    return {column: getattr(post, column) for column in POST_COLUMNS}
+
+
+# Function to pick the descendants query of whole threads: one range scan without limits,
+# the bounded walk otherwise
+def thread_query(root_ids, max_depth=None, max_replies=None):
+    if max_depth is None and max_replies is None:
+        return descendants_query(root_ids)
+    return bounded_descendants_query(root_ids, max_depth, max_replies)
+
+
+# Function to load threads as plain rows (.values(), no model instances) for serialize_threads(),
+# down to max_depth levels below the roots and max_replies replies per post; returns
+# (roots, descendants, files)
+def load_thread_rows(roots, max_depth=None, max_replies=None):
+    roots = [post_row(post) for post in roots]
+    if not roots:
+        return roots, [], []
+    return load_rows(roots, thread_query([root["id"] for root in roots], max_depth, max_replies))
+
+
+# Async variant of load_thread_rows()
+async def aload_thread_rows(roots, max_depth=None, max_replies=None):
+    roots = [post_row(post) for post in roots]
+    if not roots:
+        return roots, [], []
+    return await aload_rows(roots, thread_query([root["id"] for root in roots], max_depth, max_replies))
+
+
+# Function to load posts without their replies as rows, for serialize_threads(); returns (posts, [], files)
+def load_post_rows(posts):
+    posts = [post_row(post) for post in posts]
+    if not posts:
+        return posts, [], []
+    files = list(files_query([post["id"] for post in posts]).values(*FILE_COLUMNS))
+    return posts, [], files
+
+
+# Function to load a page of replies with their subtrees as rows, down to max_depth levels
+# below them; returns (replies, descendants, files)
+def load_reply_rows(replies, max_depth=None, max_replies=None):
+    replies = [post_row(post) for post in replies]
+    if not replies:
+        return replies, [], []
+    return load_rows(replies, bounded_descendants_query([reply["id"] for reply in replies], max_depth, max_replies))
+
+
+def load_rows(tops, query):
+    descendants = list(query.values(*POST_COLUMNS))
+    files = list(files_query([post["id"] for post in tops + descendants]).values(*FILE_COLUMNS))
+    return tops, descendants, files
+
+
+async def aload_rows(tops, query):
+    descendants = [row async for row in query.values(*POST_COLUMNS)]
+    files = [row async for row in files_query([post["id"] for post in tops + descendants]).values(*FILE_COLUMNS)]
+    return tops, descendants, files
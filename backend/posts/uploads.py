@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from .models import Blob
+from .storage import get_blob_store
+from .utils import format_size
+
+# Leading bytes of every accepted image type
+IMAGE_SIGNATURES = {
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+}
+HEADER_SIZE = 8
+
+
+# Uploaded file whose bytes are already in the blob store under sha256
+class StoredUpload(UploadedFile):
+    def __init__(self, sha256, size, name, content_type, charset=None):
+        super().__init__(get_blob_store().open(sha256), name, content_type, size, charset)
+        self.sha256 = sha256
+
+
+# Upload handler of the create endpoint: validates size and type while the chunks
+# arrive and streams them into the blob store, so an upload is never held in memory.
+# A violation stops the upload at once and is recorded in request.upload_error.
+class PostUploadHandler(FileUploadHandler):
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.total_size = 0
+        self.writer = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Reject from the Content-Length header alone, before reading the body
+        if content_length > settings.POSTS_UPLOAD_MAX_REQUEST_SIZE:
+            self.request.upload_error = self.request_size_error()
+            return QueryDict(), MultiValueDict()
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if content_type in IMAGE_SIGNATURES:
+            self.max_size = settings.POSTS_UPLOAD_MAX_IMAGE_SIZE
+        elif content_type.startswith('image'):
+            self.reject("Invalid image format. Only JPG, GIF, PNG are allowed.")
+        elif content_type == 'text/plain':
+            if not file_name.endswith('.txt'):
+                self.reject("Invalid file format. Only TXT files are allowed.")
+            self.max_size = settings.POSTS_UPLOAD_MAX_TEXT_SIZE
+        else:
+            self.reject("Unsupported file type.")
+
+        self.header = b''
+        self.writer = get_blob_store().writer()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.total_size += len(raw_data)
+        if self.total_size > settings.POSTS_UPLOAD_MAX_REQUEST_SIZE:
+            self.reject(self.request_size_error())
+        if start + len(raw_data) > self.max_size:
+            self.reject(f"{self.file_name} exceeds the {format_size(self.max_size)} size limit.")
+
+        if len(self.header) < HEADER_SIZE:
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+            if len(self.header) == HEADER_SIZE:
+                self.check_header()
+        if self.content_type == 'text/plain' and b'\x00' in raw_data:
+            self.reject(f"{self.file_name} is not a text file.")
+
+        self.writer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if len(self.header) < HEADER_SIZE:
+            self.check_header()
+        # Hold a reference until the request ends (release_uploads), so the blob
+        # cannot be deleted before an attachment references it
+        Blob.acquire(self.writer.digest())
+        sha256 = self.writer.commit()
+        self.writer = None
+        return StoredUpload(sha256, file_size, self.file_name, self.content_type, self.charset)
+
+    def upload_complete(self):
+        # Drop the partial blob of an interrupted or rejected upload
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+
+    def check_header(self):
+        signatures = IMAGE_SIGNATURES.get(self.content_type)
+        if signatures and not self.header.startswith(signatures):
+            self.reject("Invalid image file.")
+
+    def request_size_error(self):
+        return f"Upload exceeds the {format_size(settings.POSTS_UPLOAD_MAX_REQUEST_SIZE)} request limit."
+
+    def reject(self, message):
+        self.request.upload_error = message
+        # Consume the rest of the body without storing it, then answer with the error
+        raise StopUpload()
+
+
+# Function to make the create endpoint parse its request with PostUploadHandler; must run
+# before anything reads request.POST (PostCreateView installs it before authentication)
+def use_post_upload_handler(request):
+    request = getattr(request, '_request', request)
+    if any(isinstance(handler, PostUploadHandler) for handler in request.upload_handlers):
+        return
+    request.upload_handlers = [PostUploadHandler(request)]
+
+
+# Function to get the upload error recorded by PostUploadHandler, or None
+def get_upload_error(request):
+    return getattr(getattr(request, '_request', request), 'upload_error', None)
+
+
+# Function to drop the references taken by PostUploadHandler; uploads that no
+# attachment references (e.g. a rejected form) are deleted
+def release_uploads(request):
+    request = getattr(request, '_request', request)
+    for _, files in getattr(request, '_files', MultiValueDict()).lists():
+        for file in files:
+            if isinstance(file, StoredUpload):
+                Blob.release(file.sha256)
@@ -1,7 +1,21 @@
+from django.conf import settings
 from django.urls import path
 from .views import *
+from .async_views import AsyncPostCreateView, AsyncPostListView, AsyncPostEventsView
+
+if settings.POSTS_ASYNC_VIEWS:
+    create_view, list_view, events_view = AsyncPostCreateView, AsyncPostListView, AsyncPostEventsView
+else:
+    create_view, list_view, events_view = PostCreateView, PostListView, PostEventsView
 
 urlpatterns = [
-    path("create/", PostCreateView.as_view(), name="post-create"),
-    path("get/", PostListView.as_view(), name="post-list"),
+    path("create/", create_view.as_view(), name="post-create"),
+    path("get/", list_view.as_view(), name="post-list"),
+    path("events/", events_view.as_view(), name="post-events"),
+    path("search/", PostSearchView.as_view(), name="post-search"),
+    path("<int:post_id>/", PostDetailView.as_view(), name="post-detail"),
+    path("<int:post_id>/replies/", PostRepliesView.as_view(), name="post-replies"),
+    path("files/status/", FileStatusView.as_view(), name="post-file-status"),
+    path("files/<int:file_id>/", FileForPostView.as_view(), name="post-file"),
+    path("metrics/", MetricsView.as_view(), name="post-metrics"),
 ]
@@ -1,67 +1,111 @@
-import base64
+import json
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from PIL import Image
-import io
+from PIL import Image, UnidentifiedImageError
+from .storage import get_blob_store
 
-# Function to convert file to base64
-def to_base64(file):
-    file.seek(0)  # Move the pointer to the beginning of the file
-    return base64.b64encode(file.read()).decode('utf-8')
+# Optional: several times faster JSON encoding
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Function to process image
-def process_image(image):
+# Function to format a byte limit for error messages
+def format_size(size):
+    if size % (1024 * 1024) == 0:
+        return f"{size // (1024 * 1024)}MB"
+    return f"{size // 1024}KB"
+
+# Function to check the size of an uploaded image (same limit as PostUploadHandler)
+def check_file_size(file):
+    max_size = settings.POSTS_UPLOAD_MAX_IMAGE_SIZE
+    if file.size > max_size:
+        raise ValidationError(f"{file.name} exceeds the {format_size(max_size)} size limit.")
+
+# Function to check that an uploaded image has a supported format (reads only the header)
+def check_image(image):
     valid_formats = ['image/jpeg', 'image/gif', 'image/png']
     if image.content_type not in valid_formats:
         raise ValidationError("Invalid image format. Only JPG, GIF, PNG are allowed.")
-    
-    # Check image size
-    img = Image.open(image)
-    img_width, img_height = img.size
 
-    if img_width > 320 or img_height > 240:
-        # Proportional resizing
-        img.thumbnail((320, 240))
-    
-    # Convert image to RGB if it's in RGBA
-    if img.mode == 'RGBA':
-        img = img.convert('RGB')
-    
-    # Save image to byte stream
-    image_temp = io.BytesIO()
-    img.save(image_temp, format='JPEG')
-    image_temp.seek(0)
+    try:
+        image.seek(0)
+        Image.open(image)
+    except (UnidentifiedImageError, OSError):
+        raise ValidationError("Invalid image file.")
+    finally:
+        image.seek(0)
 
-    # Convert to base64
-    file_base64 = to_base64(image_temp)
-    return file_base64
-
-# Function to validate text file
+# Function to validate text file (same limit as PostUploadHandler)
 def validate_text_file(file):
-    # Check file size
-    if file.size > 100 * 1024:  # 100 KB
-        raise ValidationError("Text file exceeds the 100KB size limit.")
-    
+    max_size = settings.POSTS_UPLOAD_MAX_TEXT_SIZE
+    if file.size > max_size:
+        raise ValidationError(f"{file.name} exceeds the {format_size(max_size)} size limit.")
+
     # Check format
     if not file.name.endswith('.txt'):
         raise ValidationError("Invalid file format. Only TXT files are allowed.")
-    
-    # Convert text file to base64
-    file_base64 = to_base64(file)
-    return file_base64
 
-# Function to handle uploaded files
+    file.seek(0)
+    return file.read(), 'text/plain'
+
+# Function to store an uploaded text file; returns (sha256, size, content_type).
+# Images go through processing.prepare_attachment()
 def handle_uploaded_file(file):
-    # Check file size
-    if file.size > 5 * 1024 * 1024:  # Maximum file size 5MB
-        raise ValidationError("File size exceeds the 5MB limit.")
+    # Streamed by PostUploadHandler: already validated and stored
+    if getattr(file, 'sha256', None):
+        return file.sha256, file.size, file.content_type
+
+    if file.content_type != 'text/plain':
+        raise ValidationError("Unsupported file type.")
+    data, content_type = validate_text_file(file)
+    return get_blob_store().save(data), len(data), content_type
+
+# Function to parse a single-range "Range: bytes=..." header into inclusive (start, end)
+# Returns None when the header is absent or not a single byte range (serve the whole file)
+# and raises ValueError when the range cannot be satisfied
+def parse_range_header(header, size):
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+
+    start, sep, end = header[len('bytes='):].strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if start:
+            start = int(start)
+            end = int(end) if end else size - 1
+        elif end:
+            # Suffix range: the last N bytes
+            start = max(size - int(end), 0)
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
 
-    # Process image
-    if file.content_type.startswith('image'):
-        return process_image(file)
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    if start > end:
+        return None
+    return start, min(end, size - 1)
 
-    # Process text file
-    elif file.content_type == 'text/plain':
-        return validate_text_file(file)
+# Function to stream part of an open file in chunks, closing it at the end
+def iter_file_range(file, start, length, chunk_size=64 * 1024):
+    try:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
 
-    # Error if the file type is unsupported
-    raise ValidationError("Unsupported file type.")
+# Function to encode plain data (dicts, lists, str, int, None) to compact UTF-8 JSON
+def dump_json(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -1,134 +1,486 @@
-import re
+import logging
+import time
+from django.conf import settings
 from rest_framework.views import APIView
-from django.http import JsonResponse
+from django.views import View
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_etags, content_disposition_header, http_date
+from django.utils.crypto import constant_time_compare
 from django.core.exceptions import ValidationError
-from django.core.paginator import Paginator
-from .models import Post, FileForPost
-from .serializers import PostSerializer
+from django.db import transaction
+from .models import Post, FileForPost, ChangeSequence
+from .serializers import FileForPostSerializer, serialize_threads
 from .forms import PostFormWithCaptcha
-from .utils import handle_uploaded_file
+from .utils import parse_range_header, iter_file_range, dump_json
+from .tree import load_thread_rows, load_reply_rows, load_post_rows
+from .pagination import paginate_by_page, paginate_by_cursor, estimate_total_pages, check_sorting, get_ordering
+from .processing import prepare_attachments, save_attachments, discard_attachments
+from .cache import list_cache_key, list_etag, get_cached_list, set_cached_list, bump_list_version
+from .uploads import use_post_upload_handler, get_upload_error, release_uploads
+from .events import broker, publish_post_created, missed_events, iter_events
+from .metrics import registry
+from .search import index_post, is_available as search_is_available, check_query, search_posts
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that identify a list response (cache key and ETag)
+LIST_PARAMS = (
+    'pagination', 'cursor', 'page', 'limit', 'sort_by', 'sort_order', 'max_depth', 'max_replies_per_node',
+)
+MAX_LIST_LIMIT = 100
+
+
+# Function to build the post form from the request; returns (form, parent_id, files)
+def build_post_form(request):
+    # Validate and store uploads while they arrive (a no-op when the view installed it already)
+    use_post_upload_handler(request)
+
+    # Extract form data from request.POST
+    form_data = request.POST.dict()
+    
+    # Debug: log the raw text_html to see if newlines are preserved
+    logger.debug("Raw text_html from request: %r", request.POST.get('text_html', ''))
+    
+    # Extract files from request.FILES
+    files = request.FILES.getlist('files')
+
+    # Check for null in parent_id
+    parent_id = form_data.get("parent_id")
+    if parent_id == 'null':
+        parent_id = None  # Convert 'null' string to None
+
+    # Prepare cleaned data for form
+    cleaned_data = {
+        "username": form_data.get("username"),
+        "email": form_data.get("email"),
+        "homepage_url": form_data.get("homepage_url"),
+        "text_html": form_data.get("text_html"),
+        "captcha_0": form_data.get("captcha_0"),
+        "captcha_1": form_data.get("captcha_1"),
+        "parent_id": parent_id,
+    }
+
+    return PostFormWithCaptcha(cleaned_data), parent_id, files
+
+
+def upload_error_response(message):
+    return JsonResponse({"error": [message]}, status=400)
+
+
+def form_error_response(form):
+    errors = []
+    for field_errors in form.errors.values():
+        errors.extend(field_errors)
+    return JsonResponse({"error": errors}, status=400)
+
+
+def post_created_response(post, parent, file_records):
+    return JsonResponse({
+        "message": "Post created successfully.",
+        "post_id": post.id,
+        "parent_id": parent.id if parent else None,
+        "files": [
+            {"id": record.id, "filename": record.filename, "content_type": record.content_type, "status": record.status}
+            for record in file_records
+        ]
+    }, status=201)
+
+
+# Function to read and validate the list parameters; returns (page, limit, sort_by, sort_order)
+def parse_list_params(request):
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        raise ValidationError("page must be an integer.")
+    limit = parse_limit(request)
+
+    # Get sorting parameters (only indexed fields are accepted)
+    sort_by = request.GET.get('sort_by', 'id')
+    sort_order = request.GET.get('sort_order', 'desc')
+    check_sorting(sort_by, sort_order)
+    return page, limit, sort_by, sort_order
+
+
+# Function to read the page size of the list and replies endpoints
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', 25))
+    except ValueError:
+        raise ValidationError("limit must be an integer.")
+    if not 1 <= limit <= MAX_LIST_LIMIT:
+        raise ValidationError(f"limit must be between 1 and {MAX_LIST_LIMIT}.")
+    return limit
+
+
+# Function to read the reply tree limits; returns (max_depth, max_replies)
+def parse_tree_limits(request):
+    limits = []
+    for name, maximum in [
+        ('max_depth', settings.POSTS_LIST_MAX_DEPTH),
+        ('max_replies_per_node', settings.POSTS_LIST_MAX_REPLIES),
+    ]:
+        try:
+            value = int(request.GET.get(name, maximum))
+        except ValueError:
+            raise ValidationError(f"{name} must be an integer.")
+        if not 0 <= value <= maximum:
+            raise ValidationError(f"{name} must be between 0 and {maximum}.")
+        limits.append(value)
+    return tuple(limits)
+
+
+# Function to compute the list validators from the change sequence; returns (etag, last_modified)
+def list_validators(request, sequence):
+    etag = list_etag(sequence, request, LIST_PARAMS)
+    last_modified = int(sequence.changed_at.timestamp())
+    # Last-Modified has whole seconds: until the second of the last change is over, another
+    # write could land in it and If-Modified-Since would miss it, so only the ETag is sent
+    if time.time() < last_modified + 1:
+        last_modified = None
+    return etag, last_modified
+
+
+def add_list_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # Clients may store the list but must revalidate it on every use
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+# JSON response for plain data, encoded with orjson when it is installed
+def json_response(data, status=200):
+    return HttpResponse(dump_json(data), content_type="application/json", status=status)
+
+
+def cached_list_response(content):
+    response = HttpResponse(content, content_type="application/json", status=200)
+    response["X-Cache"] = "HIT"
+    return response
+
+
+def events_response(stream):
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def too_many_subscribers_response():
+    return JsonResponse({"error": "Too many event subscribers, try again later."}, status=503)
+
+
+# Function to write a post and its prepared attachments in one transaction; raises
+# Post.DoesNotExist for a missing parent. Returns (post, parent)
+def save_post(cleaned_data, parent_id, file_records):
+    try:
+        with transaction.atomic():
+            parent = None
+            if parent_id:
+                # Row lock: the parent cannot be deleted before the reply is inserted
+                parent = Post.objects.select_for_update().get(id=parent_id)
+
+            # Create the post from the validated data (text_html is sanitized by the form)
+            logger.debug("Text being saved to database: %r", cleaned_data['text_html'])
+            post = Post.objects.create(
+                username=cleaned_data["username"],
+                email=cleaned_data["email"],
+                homepage_url=cleaned_data.get("homepage_url") or None,
+                text_html=cleaned_data["text_html"],
+                parent=parent
+            )
+            post.set_thread_position()
+            post.update_ancestor_counters()
+            index_post(post)
+            logger.debug("Text saved in database: %r", post.text_html)
+
+            save_attachments(post, file_records)
+
+            # Cached list pages are stale and subscribers are notified once this commits
+            bump_list_version()
+            publish_post_created(post)
+    except BaseException:
+        discard_attachments(file_records)
+        raise
+    return post, parent
+
 
 class PostCreateView(APIView):
-    def post(self, request):
-        # Extract form data from request.POST
-        form_data = request.POST.dict()
-        
-        # Debug: Print the raw text_html to see if newlines are preserved
-        raw_text = request.POST.get('text_html', '')
-        print(f"Raw text_html from request: {repr(raw_text)}")
-        
-        # Extract files from request.FILES
-        files = request.FILES.getlist('files')
-
-        # Check for null in parent_id
-        parent_id = form_data.get("parent_id")
-        if parent_id == 'null':
-            parent_id = None  # Convert 'null' string to None
-
-        # Prepare cleaned data for form
-        cleaned_data = {
-            "username": form_data.get("username"),
-            "email": form_data.get("email"),
-            "homepage_url": form_data.get("homepage_url"),
-            "text_html": form_data.get("text_html"),
-            "captcha_0": form_data.get("captcha_0"),
-            "captcha_1": form_data.get("captcha_1"),
-            "parent_id": parent_id,
-        }
+    def initialize_request(self, request, *args, **kwargs):
+        # SessionAuthentication reads request.POST for its CSRF check, so the upload
+        # handler has to be in place before DRF authenticates the request
+        use_post_upload_handler(request)
+        return super().initialize_request(request, *args, **kwargs)
 
-        # Format the text_html before saving it to the database
-        formatted_text = self.format_preview(cleaned_data['text_html'])
-        cleaned_data['text_html'] = formatted_text
+    def post(self, request):
+        form, parent_id, files = build_post_form(request)
+        try:
+            return self.create_post(form, parent_id, files, request)
+        finally:
+            # Stored uploads that no attachment took are deleted here
+            release_uploads(request)
 
-        # Create the form instance
-        form = PostFormWithCaptcha(cleaned_data)
+    def create_post(self, form, parent_id, files, request):
+        upload_error = get_upload_error(request)
+        if upload_error:
+            return upload_error_response(upload_error)
 
         if not form.is_valid():
-            errors = []
-            for field_errors in form.errors.values():
-                errors.extend(field_errors)
-            return JsonResponse({"error": errors}, status=400)
+            return form_error_response(form)
 
-        parent = None
-        if parent_id:
-            try:
-                parent = Post.objects.get(id=parent_id)
-            except Post.DoesNotExist:
-                return JsonResponse({"error": f"Parent post with id={parent_id} not found."}, status=404)
-
-        # Create the post
-        print(f"Text being saved to database: {repr(cleaned_data['text_html'])}")
-        post = Post.objects.create(
-            username=cleaned_data["username"],
-            email=cleaned_data["email"],
-            homepage_url=cleaned_data.get("homepage_url") or None,
-            text_html=cleaned_data["text_html"],
-            parent=parent
-        )
-        print(f"Text saved in database: {repr(post.text_html)}")
+        # Validate, store and process every file before any database write
+        try:
+            file_records = prepare_attachments(files)
+        except ValidationError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
-        # Handle files
-        file_records = []
-        for file in files:
-            try:
-                file_base64 = handle_uploaded_file(file)
-                
-                file_record = FileForPost.objects.create(
-                    post=post,
-                    file_base64=file_base64,
-                    filename=file.name,
-                    content_type=file.content_type
-                )
-                file_records.append(file_record)
-            except ValidationError as e:
-                return JsonResponse({"error": str(e)}, status=400)
-
-        return JsonResponse({
-            "message": "Post created successfully.",
-            "post_id": post.id,
-            "parent_id": parent.id if parent else None,
-            "files": [{"filename": record.filename, "content_type": record.content_type} for record in file_records]
-        }, status=201)
-
-    def format_preview(self, text):
-        # Replace all \n with <br>
-        formatted_text = text.replace("\n", "<br>")
-
-        # Remove all tags except <a>, <i>, <strong>, <code>, <br>
-        formatted_text = re.sub(r"<(?!\/?(a|code|i|strong|br)(\s[^>]*|)\/?>)[^>]+>", "", formatted_text)
-
-        # Remove all attributes from tags except <a>, keep only href and title in <a>
-        formatted_text = re.sub(r'<(?!a\s)(\w+)([^>]*?)>', r'<\1>', formatted_text)  # Remove attributes from all tags except <a>
-        formatted_text = re.sub(r'<a([^>]*?)(?!\s(?:href|title)[^>]*)(\s[^>]*?)?>', r'<a\1>', formatted_text)  # Remove attributes except href and title from <a>
-
-        return formatted_text
+        try:
+            post, parent = save_post(form.cleaned_data, parent_id, file_records)
+        except Post.DoesNotExist:
+            return JsonResponse({"error": f"Parent post with id={parent_id} not found."}, status=404)
 
+        return post_created_response(post, parent, file_records)
 
 class PostListView(APIView):
     def get(self, request):
-        page = int(request.GET.get('page', 1))
-        limit = int(request.GET.get('limit', 25))
-        
-        # Get sorting parameters
-        sort_by = request.GET.get('sort_by', 'id')
-        sort_order = request.GET.get('sort_order', 'desc')
-
-        # Build the order_by clause
-        if sort_order == 'asc':
-            order_by = sort_by
-        else:
-            order_by = f'-{sort_by}'
+        # Answer "nothing changed" with 304 before any serialization
+        sequence = ChangeSequence.current()
+        etag, last_modified = list_validators(request, sequence)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return add_list_validators(not_modified, etag, last_modified)
+
+        cache_key = list_cache_key(sequence, request, LIST_PARAMS)
+        content = get_cached_list(cache_key)
+        if content is not None:
+            return add_list_validators(cached_list_response(content), etag, last_modified)
 
-        posts = Post.objects.filter(parent=None).order_by(order_by)
-        paginator = Paginator(posts, limit)
-        paginated_posts = paginator.get_page(page)
+        response = self.get_list(request)
+        if response.status_code == 200:
+            set_cached_list(cache_key, response.content)
+            add_list_validators(response, etag, last_modified)
+        response["X-Cache"] = "MISS"
+        return response
 
-        # Serialize the paginated posts
-        serializer = PostSerializer(paginated_posts, many=True)
+    def get_list(self, request):
+        try:
+            page, limit, sort_by, sort_order = parse_list_params(request)
+            tree_limits = parse_tree_limits(request)
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
 
-        return JsonResponse({
-            "posts": serializer.data,
-            "totalPages": paginator.num_pages,
+        posts = Post.objects.filter(parent=None)
+
+        # Opt-in keyset pagination: no COUNT(*) and no OFFSET
+        if request.GET.get('pagination') == 'cursor':
+            return self.get_cursor_page(request, posts, limit, sort_by, sort_order, tree_limits)
+
+        posts = posts.order_by(*get_ordering(sort_by, sort_order == 'desc'))
+        try:
+            page_posts, num_pages = paginate_by_page(posts, page, limit)
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+
+        # Load the replies (within the tree limits) and files of the page in a constant
+        # number of queries, as plain rows
+        rows = load_thread_rows(page_posts, *tree_limits)
+
+        return json_response({
+            "posts": serialize_threads(*rows, request),
+            "totalPages": num_pages,
             "sort_by": sort_by,
             "sort_order": sort_order,
-        }, status=200)
+        })
+
+    def get_cursor_page(self, request, posts, limit, sort_by, sort_order, tree_limits):
+        try:
+            page_posts, next_cursor, prev_cursor = paginate_by_cursor(
+                posts, sort_by, sort_order, limit, request.GET.get('cursor')
+            )
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+
+        rows = load_thread_rows(page_posts, *tree_limits)
+
+        return json_response({
+            "posts": serialize_threads(*rows, request),
+            "next": next_cursor,
+            "prev": prev_cursor,
+            # Approximate, from planner statistics; null when unavailable
+            "totalPages": estimate_total_pages(posts, limit),
+            "sort_by": sort_by,
+            "sort_order": sort_order,
+        })
+
+
+# One post with its files, without replies: GET /api/posts/<id>/. Clients fetch the node
+# announced by a post_created event instead of reloading the whole list
+class PostDetailView(APIView):
+    def get(self, request, post_id):
+        post = Post.objects.filter(id=post_id).first()
+        if post is None:
+            return JsonResponse({"error": f"Post with id={post_id} not found."}, status=404)
+
+        return json_response({"post": serialize_threads(*load_post_rows([post]), request)[0]})
+
+
+# Pages through the direct replies of one post (the "load more replies" of truncated
+# nodes), each with its subtree within the tree limits
+class PostRepliesView(APIView):
+    def get(self, request, post_id):
+        try:
+            limit = parse_limit(request)
+            tree_limits = parse_tree_limits(request)
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+
+        post = Post.objects.filter(id=post_id).only("id", "reply_count").first()
+        if post is None:
+            return JsonResponse({"error": f"Post with id={post_id} not found."}, status=404)
+
+        # Replies in display order (ids grow with the path), keyset-paginated on the parent index
+        try:
+            replies, next_cursor, prev_cursor = paginate_by_cursor(
+                Post.objects.filter(parent_id=post_id), "id", "asc", limit, request.GET.get('cursor')
+            )
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+
+        rows = load_reply_rows(replies, *tree_limits)
+
+        return json_response({
+            "post_id": post_id,
+            "reply_count": post.reply_count,
+            "replies": serialize_threads(*rows, request),
+            "next": next_cursor,
+            "prev": prev_cursor,
+        })
+
+
+# Full-text search over the text and username of posts: GET /api/posts/search/?q=...,
+# best matches first, keyset-paginated by rank. Replies are not included (see PostRepliesView)
+class PostSearchView(APIView):
+    def get(self, request):
+        if not search_is_available():
+            return JsonResponse({"error": "Search is not available on this database."}, status=501)
+        try:
+            query = check_query(request.GET.get('q', ''))
+            limit = parse_limit(request)
+            matches, next_cursor = search_posts(query, limit, request.GET.get('cursor'))
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+
+        posts = Post.objects.in_bulk([post_id for post_id, _ in matches])
+        rows = load_post_rows(posts[post_id] for post_id, _ in matches if post_id in posts)
+
+        return json_response({
+            "results": serialize_threads(*rows, request),
+            "next": next_cursor,
+        })
+
+
+# Plain Django view: DRF content negotiation would answer "Accept: image/*" with 406,
+# and reading request.user for authentication would add "Vary: Cookie" to immutable bytes
+class FileForPostView(View):
+    def get(self, request, file_id):
+        try:
+            record = FileForPost.objects.only("sha256", "size", "filename", "content_type", "status").get(id=file_id)
+        except FileForPost.DoesNotExist:
+            return JsonResponse({"error": f"File with id={file_id} not found."}, status=404)
+
+        if not record.is_ready:
+            return JsonResponse({"error": f"File with id={file_id} is {record.status}."}, status=404)
+
+        # Blobs are content-addressed, so the digest is a strong validator and never changes
+        etag = f'"{record.sha256}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "Accept-Ranges": "bytes",
+        }
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            tags = [tag.removeprefix("W/") for tag in parse_etags(if_none_match)]
+            if "*" in tags or etag in tags:
+                return HttpResponse(status=304, headers=headers)
+
+        try:
+            blob = record.open()
+        except FileNotFoundError:
+            return JsonResponse({"error": f"File with id={file_id} not found."}, status=404)
+
+        # Honor Range only if If-Range (when present) still matches this representation
+        byte_range = None
+        if request.headers.get("If-Range", etag) == etag:
+            try:
+                byte_range = parse_range_header(request.headers.get("Range"), record.size)
+            except ValueError:
+                blob.close()
+                headers["Content-Range"] = f"bytes */{record.size}"
+                return HttpResponse(status=416, headers=headers)
+
+        if byte_range:
+            start, end = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{record.size}"
+        else:
+            start, end = 0, record.size - 1
+            status = 200
+
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            iter_file_range(blob, start, length),
+            status=status,
+            content_type=record.content_type,
+            headers=headers,
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Disposition"] = content_disposition_header(
+            not record.content_type.startswith("image/"), record.filename
+        )
+        return response
+
+
+class FileStatusView(APIView):
+    MAX_IDS = 100
+
+    def get(self, request):
+        # Poll the processing status of attachments: ?ids=1,2,3
+        try:
+            ids = [int(value) for value in request.GET.get('ids', '').split(',') if value]
+        except ValueError:
+            return JsonResponse({"error": ["ids must be a comma-separated list of integers."]}, status=400)
+        if len(ids) > self.MAX_IDS:
+            return JsonResponse({"error": [f"At most {self.MAX_IDS} ids are allowed."]}, status=400)
+
+        records = FileForPost.objects.filter(id__in=ids).order_by('id')
+        serializer = FileForPostSerializer(records, many=True, context={"request": request})
+        return JsonResponse({"files": serializer.data}, status=200)
+
+
+# Plain Django view: DRF content negotiation would reject "Accept: text/event-stream"
+class PostEventsView(View):
+    def get(self, request):
+        if broker.subscriber_count() >= settings.POSTS_EVENTS_MAX_SUBSCRIBERS:
+            return too_many_subscribers_response()
+
+        # Subscribe before reading missed posts so that nothing falls in between
+        subscription = broker.subscribe()
+        missed = missed_events(request.headers.get("Last-Event-ID"))
+        return events_response(iter_events(subscription, missed))
+
+
+# Prometheus text endpoint, for staff users or a scraper with POSTS_METRICS_TOKEN
+class MetricsView(View):
+    def get(self, request):
+        if not (request.user.is_staff or self.has_valid_token(request)):
+            return JsonResponse({"error": "Staff access or a valid metrics token is required."}, status=403)
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    def has_valid_token(self, request):
+        token = settings.POSTS_METRICS_TOKEN
+        return bool(token) and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
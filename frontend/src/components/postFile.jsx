@@ -0,0 +1,49 @@
+import React, { useEffect, useState } from "react";
+import watchFileStatus from "../utils/watchFileStatus";
+
+// One attachment of a post: image preview, download link, or its processing state.
+// Pending files are polled until they are ready or failed
+function PostFile({ file: initialFile, openLightbox, imageClassName, imageStyle, linkClassName, linkStyle }) {
+  const [file, setFile] = useState(initialFile);
+
+  useEffect(() => setFile(initialFile), [initialFile]);
+
+  const isProcessing = file.status === "pending" || file.status === "processing";
+  useEffect(() => {
+    if (!isProcessing) return;
+    return watchFileStatus(file.id, setFile);
+  }, [file.id, isProcessing]);
+
+  if (file.status === "failed") {
+    return (
+      <span className="file-failed" style={{ color: "#b00", marginRight: 10 }}>
+        Could not process {file.filename}
+      </span>
+    );
+  }
+  if (!file.url) {
+    return (
+      <span className="file-pending" style={{ marginRight: 10 }}>
+        Processing {file.filename}...
+      </span>
+    );
+  }
+  if (file.content_type.startsWith("image")) {
+    return (
+      <img
+        src={file.url}
+        alt={file.filename}
+        className={imageClassName}
+        style={{ cursor: "pointer", ...imageStyle }}
+        onClick={() => openLightbox(file.url, file.filename)}
+      />
+    );
+  }
+  return (
+    <a href={file.url} download={file.filename} className={linkClassName} style={linkStyle}>
+      Download {file.filename}
+    </a>
+  );
+}
+
+export default PostFile;
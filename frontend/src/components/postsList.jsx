@@ -1,15 +1,43 @@
-import React, { useEffect, useState, forwardRef, useImperativeHandle } from "react";
+import React, { useEffect, useRef, useState, forwardRef, useImperativeHandle } from "react";
 import PostForm from "./postsForm";
+import PostFile from "./postFile";
 
 const API_URL = import.meta.env.VITE_API_URL;
 const POSTS_PER_PAGE = 25;
+const REPLIES_PER_PAGE = 25;
+// The events stream holds a server thread per viewer unless the backend runs the async
+// views under ASGI (POSTS_ASYNC_VIEWS), so it is opt-in
+const EVENTS_ENABLED = import.meta.env.VITE_POSTS_EVENTS === "true";
+
+function containsPost(nodes, id) {
+  return nodes.some((node) => node.id === id || containsPost(node.replies || [], id));
+}
+
+// Returns the nodes with a new reply added under its parent, or null when the parent is not shown.
+// A parent whose replies are only partly loaded counts it in omitted_replies instead
+function insertReply(nodes, parentId, reply) {
+  let inserted = false;
+  const visit = (list) =>
+    list.map((node) => {
+      if (inserted) return node;
+      if (node.id === parentId) {
+        inserted = true;
+        return node.omitted_replies > 0
+          ? { ...node, omitted_replies: node.omitted_replies + 1 }
+          : { ...node, replies: [...(node.replies || []), reply] };
+      }
+      return node.replies && node.replies.length ? { ...node, replies: visit(node.replies) } : node;
+    });
+  const result = visit(nodes);
+  return inserted ? result : null;
+}
 
 function CommentsList({ comments, replyTo, setReplyTo, onReplySuccess, openLightbox }) {
   if (!comments || comments.length === 0) return null;
 
   return (
     <div className="comments-list" style={{ marginLeft: 20 }}>
-      {comments.map(({ id, username, text_html, created_at, replies = [], files = [] }) => {
+      {comments.map(({ id, username, text_html, created_at, replies = [], files = [], omitted_replies = 0 }) => {
         const fixedHtml = text_html.replace(/\n/g, "<br />");
         return (
           <div
@@ -36,29 +64,15 @@ function CommentsList({ comments, replyTo, setReplyTo, onReplySuccess, openLight
             {files.length > 0 && (
               <div className="files-section" style={{ marginBottom: 8 }}>
                 <h4>Files:</h4>
-                {files.map((file, idx) => (
-                  <div key={idx} className="file-item" style={{ marginBottom: 4 }}>
-                    {file.content_type.startsWith("image") ? (
-                      <img
-                        src={`data:${file.content_type};base64,${file.file_base64}`}
-                        alt={file.filename}
-                        className="file-image"
-                        style={{ maxWidth: "150px", cursor: "pointer" }}
-                        onClick={() =>
-                          openLightbox(`data:${file.content_type};base64,${file.file_base64}`, file.filename)
-                        }
-                      />
-                    ) : (
-                      <div>
-                        <a
-                          href={`data:${file.content_type};base64,${file.file_base64}`}
-                          download={file.filename}
-                          className="file-download"
-                        >
-                          Download {file.filename}
-                        </a>
-                      </div>
-                    )}
+                {files.map((file) => (
+                  <div key={file.id} className="file-item" style={{ marginBottom: 4 }}>
+                    <PostFile
+                      file={file}
+                      openLightbox={openLightbox}
+                      imageClassName="file-image"
+                      imageStyle={{ maxWidth: "150px" }}
+                      linkClassName="file-download"
+                    />
                   </div>
                 ))}
               </div>
@@ -74,8 +88,10 @@ function CommentsList({ comments, replyTo, setReplyTo, onReplySuccess, openLight
               />
             )}
 
-            <CommentsList
-              comments={replies}
+            <Replies
+              postId={id}
+              replies={replies}
+              omitted={omitted_replies}
               replyTo={replyTo}
               setReplyTo={setReplyTo}
               onReplySuccess={onReplySuccess}
@@ -88,6 +104,58 @@ function CommentsList({ comments, replyTo, setReplyTo, onReplySuccess, openLight
   );
 }
 
+// Replies of one post; the ones left out by the list limits are loaded page by page
+function Replies({ postId, replies, omitted, ...listProps }) {
+  const [loaded, setLoaded] = useState(null);
+  const [next, setNext] = useState(null);
+  const [loading, setLoading] = useState(false);
+
+  // A reloaded list brings fresh replies
+  useEffect(() => {
+    setLoaded(null);
+    setNext(null);
+  }, [replies]);
+
+  const loadMore = async () => {
+    setLoading(true);
+    try {
+      const url = new URL(`${API_URL}/api/posts/${postId}/replies/`);
+      url.searchParams.append("limit", REPLIES_PER_PAGE);
+      if (next) url.searchParams.append("cursor", next);
+
+      const res = await fetch(url);
+      if (!res.ok) throw new Error("Failed to fetch replies");
+      const data = await res.json();
+      // The first page starts again from the first reply
+      setLoaded((prev) => (next && prev ? [...prev, ...data.replies] : data.replies));
+      setNext(data.next);
+    } catch (err) {
+      alert(err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const shown = loaded || replies;
+  const remaining = !loaded ? omitted : next ? replies.length + omitted - loaded.length : 0;
+
+  return (
+    <>
+      <CommentsList comments={shown} {...listProps} />
+      {remaining > 0 && (
+        <button
+          className="button"
+          disabled={loading}
+          onClick={loadMore}
+          style={{ marginLeft: 20, marginBottom: 10 }}
+        >
+          {loading ? "Loading..." : `Show ${remaining} more ${remaining === 1 ? "reply" : "replies"}`}
+        </button>
+      )}
+    </>
+  );
+}
+
 const PostsList = forwardRef((props, ref) => {
   const [posts, setPosts] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -98,6 +166,10 @@ const PostsList = forwardRef((props, ref) => {
   const [lightbox, setLightbox] = useState({ isOpen: false, src: "", alt: "" });
   const [sortConfig, setSortConfig] = useState({ key: "id", direction: "desc" });
   const [expandedPosts, setExpandedPosts] = useState(new Set());
+  const [newPostsCount, setNewPostsCount] = useState(0);
+  // Read by the events handler, which is set up once
+  const view = useRef({});
+  view.current = { posts, currentPage, sortConfig };
 
   const openLightbox = (src, alt) => setLightbox({ isOpen: true, src, alt });
   const closeLightbox = () => setLightbox({ isOpen: false, src: "", alt: "" });
@@ -117,6 +189,7 @@ const PostsList = forwardRef((props, ref) => {
       const data = await res.json();
       setPosts(data.posts || []);
       setTotalPages(data.totalPages || 1);
+      setNewPostsCount(0);
     } catch (err) {
       setError(err.message);
     } finally {
@@ -164,12 +237,56 @@ const PostsList = forwardRef((props, ref) => {
     fetchPosts(currentPage, sortConfig.key, sortConfig.direction);
   }, [currentPage, sortConfig.key, sortConfig.direction]);
 
+  // Fetches only the post announced by an event and adds it where it is shown: new threads
+  // on the first page of the newest first order, replies under a shown parent. Other posts
+  // are counted for the "Show new comments" button
+  const addNewPost = async ({ id, parent_id: parentId }) => {
+    const { posts: shown, currentPage: page, sortConfig: sort } = view.current;
+    if (containsPost(shown, id)) return;
+    const isNewestFirst = page === 1 && sort.key === "id" && sort.direction === "desc";
+    if (parentId === null ? !isNewestFirst : !containsPost(shown, parentId)) {
+      setNewPostsCount((count) => count + 1);
+      return;
+    }
+
+    try {
+      const res = await fetch(`${API_URL}/api/posts/${id}/`);
+      if (!res.ok) throw new Error("Failed to fetch post");
+      const { post } = await res.json();
+
+      const current = view.current.posts;
+      if (containsPost(current, id)) return;
+      const updated =
+        parentId === null ? [post, ...current].slice(0, POSTS_PER_PAGE) : insertReply(current, parentId, post);
+      if (updated) setPosts(updated);
+      else setNewPostsCount((count) => count + 1);
+    } catch {
+      setNewPostsCount((count) => count + 1);
+    }
+  };
+
+  // New posts are pushed by the server instead of polling the list
+  useEffect(() => {
+    if (!EVENTS_ENABLED) return;
+    const events = new EventSource(`${API_URL}/api/posts/events/`);
+    events.addEventListener("post_created", (event) => addNewPost(JSON.parse(event.data)));
+    return () => events.close();
+  }, []);
+
   if (loading) return <p className="loading">Loading posts...</p>;
   if (error) return <p className="error">Error: {error}</p>;
   if (!posts.length) return <p className="loading">No posts found.</p>;
 
   return (
     <div className="posts-list-container">
+      {newPostsCount > 0 && (
+        <button
+          className="new-posts"
+          onClick={() => fetchPosts(currentPage, sortConfig.key, sortConfig.direction)}
+        >
+          Show {newPostsCount} new {newPostsCount === 1 ? "comment" : "comments"}
+        </button>
+      )}
       <table className="posts-table" style={{ width: "100%", borderCollapse: "collapse" }}>
         <thead>
           <tr>
@@ -191,7 +308,7 @@ const PostsList = forwardRef((props, ref) => {
         </thead>
 
         <tbody>
-          {posts.map(({ id, username, email, homepage_url, text_html, created_at, replies = [], files = [] }) => {
+          {posts.map(({ id, username, email, homepage_url, text_html, created_at, replies = [], files = [], omitted_replies = 0 }) => {
             const isExpanded = expandedPosts.has(id);
             const fixedHtml = text_html.replace(/\n/g, "<br />");
             return (
@@ -213,26 +330,15 @@ const PostsList = forwardRef((props, ref) => {
                     {files.length > 0 && (
                       <div>
                         <h4>Files:</h4>
-                        {files.map((file, idx) =>
-                          file.content_type.startsWith("image") ? (
-                            <img
-                              key={idx}
-                              src={`data:${file.content_type};base64,${file.file_base64}`}
-                              alt={file.filename}
-                              style={{ maxWidth: 150, cursor: "pointer", marginRight: 5 }}
-                              onClick={() => openLightbox(`data:${file.content_type};base64,${file.file_base64}`, file.filename)}
-                            />
-                          ) : (
-                            <a
-                              key={idx}
-                              href={`data:${file.content_type};base64,${file.file_base64}`}
-                              download={file.filename}
-                              style={{ display: "inline-block", marginRight: 10 }}
-                            >
-                              Download {file.filename}
-                            </a>
-                          )
-                        )}
+                        {files.map((file) => (
+                          <PostFile
+                            key={file.id}
+                            file={file}
+                            openLightbox={openLightbox}
+                            imageStyle={{ maxWidth: 150, marginRight: 5 }}
+                            linkStyle={{ display: "inline-block", marginRight: 10 }}
+                          />
+                        ))}
                       </div>
                     )}
                   </td>
@@ -244,7 +350,7 @@ const PostsList = forwardRef((props, ref) => {
                       {replyTo === id ? "Cancel" : "Reply"}
                     </button>
 
-                    {replies.length > 0 && (
+                    {(replies.length > 0 || omitted_replies > 0) && (
                       <button
                         className="button"
                         style={{ marginLeft: 8 }}
@@ -276,8 +382,10 @@ const PostsList = forwardRef((props, ref) => {
                 {isExpanded && (
                   <tr>
                     <td colSpan={6} style={{ background: "#f9f9f9", padding: "10px 20px" }}>
-                      <CommentsList
-                        comments={replies}
+                      <Replies
+                        postId={id}
+                        replies={replies}
+                        omitted={omitted_replies}
                         replyTo={replyTo}
                         setReplyTo={setReplyTo}
                         onReplySuccess={() => {
@@ -0,0 +1,42 @@
+const API_URL = import.meta.env.VITE_API_URL;
+const POLL_INTERVAL = 3000;
+const MAX_IDS = 100; // FileStatusView.MAX_IDS
+
+// Attachments still being processed, polled together with one request per MAX_IDS files
+const watchers = new Map();
+let timer = null;
+
+const poll = async () => {
+  const ids = [...watchers.keys()];
+  for (let start = 0; start < ids.length; start += MAX_IDS) {
+    try {
+      const url = new URL(`${API_URL}/api/posts/files/status/`);
+      url.searchParams.append("ids", ids.slice(start, start + MAX_IDS).join(","));
+      const res = await fetch(url);
+      if (!res.ok) throw new Error("Failed to fetch file status");
+      const data = await res.json();
+      data.files.forEach((file) => {
+        if (file.status === "pending" || file.status === "processing") return;
+        (watchers.get(file.id) || []).forEach((callback) => callback(file));
+        watchers.delete(file.id);
+      });
+    } catch (error) {
+      console.error("Error polling file status:", error);
+    }
+  }
+  timer = watchers.size > 0 ? setTimeout(poll, POLL_INTERVAL) : null;
+};
+
+// Calls onDone(file) once the attachment is ready or failed; returns a function that stops watching
+const watchFileStatus = (id, onDone) => {
+  watchers.set(id, [...(watchers.get(id) || []), onDone]);
+  if (!timer) timer = setTimeout(poll, POLL_INTERVAL);
+
+  return () => {
+    const callbacks = (watchers.get(id) || []).filter((callback) => callback !== onDone);
+    if (callbacks.length > 0) watchers.set(id, callbacks);
+    else watchers.delete(id);
+  };
+};
+
+export default watchFileStatus;